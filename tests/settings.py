@@ -21,6 +21,14 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
     },
+    # stand-in for a read replica, see WAGTAILCSVIMPORT_EXPORT_DATABASE.
+    # A separate connection to the same DB, Wagtail's data migrations
+    # can't be run on more than one DB.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
 SECRET_KEY = 'dummy'
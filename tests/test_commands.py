@@ -0,0 +1,63 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+import pytz
+
+from wagtail.core.models import Page
+
+from tests.models import SimplePage
+
+
+class ExportPagesCommandTests(TestCase):
+
+    def setUp(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Test page', int_field=42))
+        home.add_child(instance=SimplePage(title='Draft page', int_field=27, live=False))
+
+    def test_export_to_stdout(self):
+        stdout = StringIO()
+        call_command('export_pages', '2', '--page-type', 'tests.SimplePage',
+                     '--fields', 'id,title,int_field', '--workers', '1', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'id,title,int_field\r\n3,Test page,42\r\n')
+
+    def test_export_all_to_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'export.csv')
+            call_command('export_pages', '2', '--all', '--specific', '--fields',
+                         'id,int_field', '--workers', '1', '--output', output)
+            with open(output, encoding='utf-8', newline='') as f:
+                self.assertEqual(f.read(), 'id,int_field\r\n2,\r\n3,42\r\n4,27\r\n')
+
+    def test_export_multiple_roots(self):
+        stdout = StringIO()
+        call_command('export_pages', '3', '4', '--all', '--fields', 'id,title',
+                     '--workers', '1', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'id,title\r\n3,Test page\r\n4,Draft page\r\n')
+
+    def test_export_since(self):
+        SimplePage.objects.filter(pk=3).update(
+            latest_revision_created_at=pytz.datetime.datetime(2019, 3, 1, tzinfo=pytz.UTC)
+        )
+        stdout = StringIO()
+        call_command('export_pages', '2', '--all', '--specific', '--fields', 'id,title',
+                     '--since', '2019-02-01T00:00:00', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'id,title\r\n3,Test page\r\n')
+
+    def test_errors(self):
+        with self.assertRaisesMessage(CommandError, 'Page with id 42 does not exist'):
+            call_command('export_pages', '42')
+        with self.assertRaisesMessage(CommandError, 'Page with id 42 does not exist'):
+            call_command('export_pages', '2', '42')
+        with self.assertRaisesMessage(CommandError, 'Unknown page type tests.wrongpage'):
+            call_command('export_pages', '2', '--page-type', 'tests.wrongpage')
+        with self.assertRaisesMessage(CommandError, 'tests.notapage is not a page type'):
+            call_command('export_pages', '2', '--page-type', 'tests.notapage')
+        with self.assertRaisesMessage(CommandError, 'Invalid datetime yesterday'):
+            call_command('export_pages', '2', '--since', 'yesterday')
+        with self.assertRaisesMessage(CommandError, "Don't recognize these fields: ['wrong_field']"):
+            call_command('export_pages', '2', '--fields', 'id,wrong_field', stdout=StringIO())
@@ -1,10 +1,39 @@
+import gzip
+import json
+import multiprocessing
+from unittest import mock
+from unittest import skipIf
+from unittest import skipUnless
+
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.db import connections
+from django.db.models.signals import m2m_changed
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 import pytz
 from wagtail.core.models import Page
+from wagtail.core.models import Site
 
+from wagtailcsvimport.exporting import ExportPlan
+from wagtailcsvimport.exporting import PageURLResolver
+from wagtailcsvimport.exporting import buffer_rows
+from wagtailcsvimport.exporting import compress_blocks
+from wagtailcsvimport.exporting import decode_cursor
+from wagtailcsvimport.exporting import encode_cursor
+from wagtailcsvimport.exporting import zstandard
 from wagtailcsvimport.exporting import export_pages
+from wagtailcsvimport.exporting import export_pages_parallel
+from wagtailcsvimport.exporting import get_path_ranges
 from wagtailcsvimport.exporting import get_exportable_fields_for_model
+from wagtailcsvimport.exporting import get_generated_fields_for_model
+from wagtailcsvimport.exporting import register_generated_field
+from wagtailcsvimport.exporting import update_export_rows
+
+from wagtailcsvimport.models import ExportRow
 
 from tests.models import M2MPage
 from tests.models import SimplePage
@@ -30,6 +59,31 @@ class ExportingTests(TestCase):
         else:
             self.fail(f"Iterator has less items than expected. First missing item: {missing_item!r}")
 
+    def test_buffer_rows(self):
+        rows = ['id,title\r\n', '1,Root\r\n', '2,Café\r\n', '3,Other\r\n']
+        self.assertEqual(
+            list(buffer_rows(rows, buffer_size=16)),
+            [b'id,title\r\n1,Root\r\n', '2,Café\r\n3,Other\r\n'.encode('utf-8')]
+        )
+        self.assertEqual(list(buffer_rows(rows, buffer_size=1)), [r.encode('utf-8') for r in rows])
+        self.assertEqual(list(buffer_rows([], buffer_size=16)), [])
+
+    def test_compress_blocks_gzip(self):
+        blocks = [b'id,title\r\n', b'1,Root\r\n' * 1000]
+        compressed = b''.join(compress_blocks(iter(blocks), 'gzip'))
+        self.assertEqual(gzip.decompress(compressed), b''.join(blocks))
+
+    @skipIf(zstandard is None, 'zstandard is not installed')
+    def test_compress_blocks_zstd(self):
+        blocks = [b'id,title\r\n', b'1,Root\r\n' * 1000]
+        compressed = b''.join(compress_blocks(iter(blocks), 'zstd'))
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(compressed),
+                         b''.join(blocks))
+
+    def test_compress_blocks_unsupported_encoding(self):
+        with self.assertRaisesMessage(ValueError, 'Unsupported compression encoding: br'):
+            list(compress_blocks(iter([b'id\r\n']), 'br'))
+
     def test_export_error_if_unrecognized_fields(self):
         ct = ContentType.objects.get_for_model(SimplePage)
         home = Page.objects.get(slug='home')
@@ -65,6 +119,369 @@ class ExportingTests(TestCase):
             ]
         )
 
+    def test_export_parent_constant_queries(self):
+        home = Page.objects.get(pk=2)
+        parent = home.add_child(instance=SimplePage(title='Parent', int_field=1))
+        for i in range(5):
+            parent.add_child(instance=SimplePage(title=f'Child {i}', int_field=i))
+
+        # one query for the pages, one for the parent of the root page
+        with self.assertNumQueries(2):
+            rows = list(export_pages(home, fieldnames=['id', 'parent']))
+        self.assertEqual(
+            rows,
+            ['id,parent\r\n', '2,1\r\n', '3,2\r\n', '4,3\r\n', '5,3\r\n',
+             '6,3\r\n', '7,3\r\n', '8,3\r\n']
+        )
+
+    def test_export_parent_across_chunks(self):
+        home = Page.objects.get(pk=2)
+        parent = home.add_child(instance=SimplePage(title='Parent', int_field=1))
+        for i in range(3):
+            parent.add_child(instance=SimplePage(title=f'Child {i}', int_field=i))
+
+        with mock.patch('wagtailcsvimport.exporting.EXPORT_CHUNK_SIZE', 2):
+            rows = list(export_pages(home, fieldnames=['id', 'parent']))
+        self.assertEqual(
+            rows,
+            ['id,parent\r\n', '2,1\r\n', '3,2\r\n', '4,3\r\n', '5,3\r\n', '6,3\r\n']
+        )
+
+    def test_export_plan_rows(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(
+            title='Test page', int_field=42, bool_field=False,
+            first_published_at=pytz.datetime.datetime(2019, 1, 1, 1, 1, 1, tzinfo=pytz.UTC)
+        ))
+        plan = ExportPlan(SimplePage, ['id', 'content_type', 'int_field', 'bool_field',
+                                       'first_published_at', 'last_published_at', 'owner'])
+        self.assertEqual(len(plan.extractors), 7)
+        rows = list(plan.get_rows(list(SimplePage.objects.all())))
+        self.assertEqual(
+            rows,
+            [[3, 'tests.simplepage', 42, False, '2019-01-01 01:01:01', None, None]]
+        )
+
+    def test_export_content_type_constant_queries(self):
+        home = Page.objects.get(pk=2)
+        for i in range(5):
+            home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+        ContentType.objects.clear_cache()
+
+        # one query for the pages, one for each distinct content type
+        with self.assertNumQueries(3):
+            rows = list(export_pages(home, fieldnames=['id', 'content_type']))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[1], '2,wagtailcore.page\r\n')
+        self.assertEqual(rows[2], '3,tests.simplepage\r\n')
+
+    def test_export_keyset_pagination_in_tree_order(self):
+        home = Page.objects.get(pk=2)
+        section_1 = home.add_child(instance=SimplePage(title='Section 1', int_field=1))
+        section_2 = home.add_child(instance=SimplePage(title='Section 2', int_field=2))
+        section_2.add_child(instance=SimplePage(title='Child 2', int_field=3))
+        section_1.add_child(instance=SimplePage(title='Child 1', int_field=4))
+
+        # one query per chunk of pages, last one is not full
+        with mock.patch('wagtailcsvimport.exporting.EXPORT_CHUNK_SIZE', 2), \
+                CaptureQueriesContext(connection) as queries:
+            rows = list(export_pages(home, fieldnames=['id', 'parent', 'title']))
+        self.assertEqual(
+            rows,
+            [
+                'id,parent,title\r\n',
+                '2,1,Welcome to your new Wagtail site!\r\n',
+                '3,2,Section 1\r\n',
+                '6,3,Child 1\r\n',
+                '4,2,Section 2\r\n',
+                '5,4,Child 2\r\n',
+            ]
+        )
+        pages_queries = [q['sql'] for q in queries if 'LIMIT 2' in q['sql']]
+        self.assertEqual(len(pages_queries), 3)
+        self.assertNotIn('"path" >', pages_queries[0])
+        self.assertIn('"path" > \'000100010001\'', pages_queries[1])
+        self.assertIn('"path" > \'000100010002\'', pages_queries[2])
+
+    def test_export_root_page_has_no_parent(self):
+        root = Page.objects.get(depth=1)
+        rows = list(export_pages(root, fieldnames=['id', 'parent']))
+        self.assertEqual(rows, ['id,parent\r\n', '1,\r\n', '2,1\r\n'])
+
+    def test_export_multiple_roots(self):
+        home = Page.objects.get(pk=2)
+        sections = [home.add_child(instance=Page(title=f'Section {i}')) for i in range(3)]
+        for section in sections:
+            section.add_child(instance=Page(title=f'Child of {section.title}'))
+
+        # second section is included twice, the last child is in
+        # the subtree of the last section
+        roots = [sections[2], sections[0], sections[2], sections[2].get_children().get()]
+        with self.assertNumQueries(1):
+            rows = list(export_pages(roots, fieldnames=['id', 'title']))
+        self.assertEqual(
+            rows,
+            [
+                'id,title\r\n',
+                '3,Section 0\r\n',
+                '6,Child of Section 0\r\n',
+                '5,Section 2\r\n',
+                '8,Child of Section 2\r\n',
+            ]
+        )
+
+    def test_export_m2m_constant_queries(self):
+        home = Page.objects.get(slug='home')
+        simple_page_1 = home.add_child(instance=SimplePage(title='Simple page 1', int_field=1))
+        simple_page_2 = home.add_child(instance=SimplePage(title='Simple page 2', int_field=2))
+        m2m_pages = []
+        for i in range(4):
+            m2m_page = home.add_child(instance=M2MPage(title=f'M2M page {i}'))
+            m2m_pages.append(m2m_page)
+        m2m_pages[0].m2m.add(simple_page_2, simple_page_1)
+        m2m_pages[2].m2m.add(simple_page_2)
+
+        ct = ContentType.objects.get_for_model(M2MPage)
+        # one query for the pages, one for the M2M relations
+        with self.assertNumQueries(2):
+            rows = list(export_pages(home, content_type=ct, fieldnames=['id', 'm2m']))
+        self.assertEqual(
+            rows,
+            [
+                'id,m2m\r\n',
+                f'{m2m_pages[0].pk},"{simple_page_1.pk},{simple_page_2.pk}"\r\n',
+                f'{m2m_pages[1].pk},\r\n',
+                f'{m2m_pages[2].pk},{simple_page_2.pk}\r\n',
+                f'{m2m_pages[3].pk},\r\n',
+            ]
+        )
+
+    def test_export_m2m_uses_related_default_manager(self):
+        home = Page.objects.get(slug='home')
+        simple_page_1 = home.add_child(instance=SimplePage(title='Simple page 1', int_field=1))
+        simple_page_2 = home.add_child(instance=SimplePage(title='Simple page 2', int_field=2))
+        m2m_page = home.add_child(instance=M2MPage(title='M2M page'))
+        m2m_page.m2m.add(simple_page_1, simple_page_2)
+
+        # a default manager that hides some objects, e.g. soft deleted ones
+        manager_class = type(SimplePage._default_manager)
+        get_queryset = manager_class.get_queryset
+        ct = ContentType.objects.get_for_model(M2MPage)
+        with mock.patch.object(manager_class, 'get_queryset',
+                               lambda self: get_queryset(self).exclude(pk=simple_page_2.pk)):
+            self.assertEqual(list(m2m_page.m2m.all()), [simple_page_1])
+            rows = list(export_pages(home, content_type=ct, fieldnames=['id', 'm2m']))
+        self.assertEqual(rows, ['id,m2m\r\n', f'{m2m_page.pk},{simple_page_1.pk}\r\n'])
+
+    def test_export_loads_only_selected_columns(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(
+            title='Test page', int_field=42, rich_text_field='<p>Long rich text</p>'
+        ))
+        ct = ContentType.objects.get_for_model(SimplePage)
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(export_pages(home, content_type=ct,
+                                     fieldnames=['id', 'parent', 'full_url', 'int_field']))
+        self.assertEqual(
+            rows,
+            ['id,parent,full_url,int_field\r\n', '3,2,http://localhost/test-page/,42\r\n']
+        )
+        pages_query = next(q['sql'] for q in queries if 'tests_simplepage' in q['sql'])
+        self.assertIn('"int_field"', pages_query)
+        self.assertIn('"url_path"', pages_query)
+        self.assertNotIn('"rich_text_field"', pages_query)
+        self.assertNotIn('"char_field"', pages_query)
+        self.assertNotIn('"seo_title"', pages_query)
+
+    def test_export_specific_fields_of_all_page_types(self):
+        home = Page.objects.get(pk=2)
+        simple_page = home.add_child(instance=SimplePage(
+            title='Simple page', int_field=42, char_field='char'
+        ))
+        m2m_page = home.add_child(instance=M2MPage(title='M2M page', fk=simple_page))
+        m2m_page.m2m.add(simple_page)
+        simple_page.add_child(instance=SimplePage(title='Child page', int_field=27))
+
+        fieldnames = ['id', 'content_type', 'parent', 'title', 'char_field', 'fk', 'int_field', 'm2m']
+        # pages and content types, then for every chunk and page type
+        # the specific pages, plus parent and M2M lookups
+        with self.assertNumQueries(7):
+            rows = list(export_pages(home, fieldnames=fieldnames, specific=True))
+        self.assertEqual(
+            rows,
+            [
+                'id,content_type,parent,title,char_field,fk,int_field,m2m\r\n',
+                '2,wagtailcore.page,1,Welcome to your new Wagtail site!,,,,\r\n',
+                '3,tests.simplepage,2,Simple page,char,,42,\r\n',
+                '5,tests.simplepage,3,Child page,,,27,\r\n',
+                '4,tests.m2mpage,2,M2M page,,3,,3\r\n',
+            ]
+        )
+
+    def test_export_specific_page_type_added_during_export(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Simple page', int_field=42))
+
+        rows = export_pages(home, specific=True, fieldnames=['id', 'title', 'int_field'])
+        self.assertEqual(next(rows), 'id,title,int_field\r\n')
+        home.add_child(instance=M2MPage(title='M2M page'))
+        self.assertEqual(
+            list(rows),
+            [
+                '2,Welcome to your new Wagtail site!,\r\n',
+                '3,Simple page,42\r\n',
+                '4,M2M page,\r\n',
+            ]
+        )
+
+    def test_export_specific_default_fields(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Simple page', int_field=42))
+
+        rows = list(export_pages(home, specific=True))
+        self.assertEqual(
+            rows[0],
+            'id,content_type,parent,title,slug,full_url,live,bool_field,char_field,draft_title,expire_at,expired,first_published_at,go_live_at,has_unpublished_changes,int_field,last_published_at,latest_revision_created_at,live_revision,locked,owner,rich_text_field,search_description,seo_title,show_in_menus\r\n'
+        )
+        self.assertEqual(len(rows), 3)
+
+    def test_export_specific_error_if_unrecognized_fields(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Simple page', int_field=42))
+
+        with self.assertRaisesMessage(ValueError, "Don't recognize these fields: ['m2m']"):
+            next(export_pages(home, fieldnames=['id', 'int_field', 'm2m'], specific=True))
+
+    def test_export_since(self):
+        home = Page.objects.get(pk=2)
+        old_page = home.add_child(instance=SimplePage(
+            title='Old page', int_field=1,
+            first_published_at=pytz.datetime.datetime(2019, 1, 1, tzinfo=pytz.UTC),
+            last_published_at=pytz.datetime.datetime(2019, 1, 1, tzinfo=pytz.UTC),
+        ))
+        old_page.add_child(instance=SimplePage(
+            title='Republished page', int_field=2,
+            first_published_at=pytz.datetime.datetime(2019, 1, 1, tzinfo=pytz.UTC),
+            last_published_at=pytz.datetime.datetime(2019, 3, 1, tzinfo=pytz.UTC),
+        ))
+        home.add_child(instance=SimplePage(
+            title='Revised page', int_field=3,
+            latest_revision_created_at=pytz.datetime.datetime(2019, 3, 1, tzinfo=pytz.UTC),
+        ))
+        home.add_child(instance=SimplePage(title='Never published page', int_field=4))
+
+        since = pytz.datetime.datetime(2019, 2, 1, tzinfo=pytz.UTC)
+        rows = list(export_pages(home, fieldnames=['id', 'title'], since=since))
+        self.assertEqual(rows, ['id,title\r\n', '4,Republished page\r\n', '5,Revised page\r\n'])
+
+    def test_export_with_cursor_resumes_after_last_row(self):
+        home = Page.objects.get(pk=2)
+        for i in range(3):
+            home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+
+        rows = list(export_pages(home, fieldnames=['id', 'title'], with_cursor=True))
+        self.assertEqual(rows[0], 'id,title,_cursor\r\n')
+        self.assertEqual(rows[2], f'3,Page 0,{encode_cursor("000100010001")}\r\n')
+
+        # resume after the second page
+        after = decode_cursor(rows[2].rstrip().rsplit(',', 1)[1])
+        self.assertEqual(after, '000100010001')
+        resumed = list(export_pages(home, fieldnames=['id', 'title'],
+                                    after=after, with_cursor=True))
+        self.assertEqual(resumed[0], rows[0])
+        self.assertEqual(resumed[1:], rows[3:])
+
+    def test_export_with_cursor_specific(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Simple page', int_field=42))
+
+        rows = list(export_pages(home, fieldnames=['id', 'int_field'],
+                                 specific=True, with_cursor=True))
+        self.assertEqual(
+            rows,
+            [
+                'id,int_field,_cursor\r\n',
+                f'2,,{encode_cursor("00010001")}\r\n',
+                f'3,42,{encode_cursor("000100010001")}\r\n',
+            ]
+        )
+
+    def test_export_specific_resumed_has_same_header(self):
+        home = Page.objects.get(pk=2)
+        simple_page = home.add_child(instance=SimplePage(title='Simple page', int_field=42))
+        home.add_child(instance=M2MPage(title='M2M page', fk=simple_page))
+        home.add_child(instance=SimplePage(title='Last page', int_field=27))
+
+        rows = list(export_pages(home, specific=True, with_cursor=True))
+        # resume after the M2M page, only simple pages are left
+        after = decode_cursor(rows[3].rstrip().rsplit(',', 1)[1])
+        resumed = list(export_pages(home, specific=True, after=after, with_cursor=True))
+        self.assertIn('fk', resumed[0].split(','))
+        self.assertEqual(resumed, [rows[0]] + rows[4:])
+
+    def test_export_shards_are_disjoint(self):
+        home = Page.objects.get(pk=2)
+        for i in range(5):
+            home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+
+        all_rows = list(export_pages(home, fieldnames=['id', 'title']))
+        shards = [
+            list(export_pages(home, fieldnames=['id', 'title'], shard=(i, 3)))
+            for i in range(3)
+        ]
+        self.assertEqual(shards[0], ['id,title\r\n', '2,Welcome to your new Wagtail site!\r\n',
+                                     '3,Page 0\r\n'])
+        for shard_rows in shards:
+            self.assertEqual(shard_rows[0], all_rows[0])
+        # shards are contiguous ranges of the tree
+        self.assertEqual(sum((rows[1:] for rows in shards), []), all_rows[1:])
+
+        with CaptureQueriesContext(connection) as queries:
+            list(export_pages(home, fieldnames=['id', 'title'], shard=(1, 3)))
+        # pages of the shard are read by path range
+        self.assertIn('"wagtailcore_page"."path" >= ', queries[-1]['sql'])
+        self.assertIn('"wagtailcore_page"."path" < ', queries[-1]['sql'])
+
+    def test_export_specific_shards_have_same_header(self):
+        home = Page.objects.get(pk=2)
+        simple_page = home.add_child(instance=SimplePage(title='Simple page', int_field=42))
+        home.add_child(instance=M2MPage(title='M2M page', fk=simple_page))
+        home.add_child(instance=SimplePage(title='Last page', int_field=27))
+
+        all_rows = list(export_pages(home, specific=True))
+        shards = [list(export_pages(home, specific=True, shard=(i, 2))) for i in range(2)]
+        self.assertEqual([rows[0] for rows in shards], [all_rows[0], all_rows[0]])
+        self.assertEqual(shards[0][1:] + shards[1][1:], all_rows[1:])
+
+    def test_export_shards_more_than_pages(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Page', int_field=1))
+        shards = [
+            list(export_pages(home, fieldnames=['id', 'title'], shard=(i, 3)))
+            for i in range(3)
+        ]
+        self.assertEqual(shards[0], ['id,title\r\n'])
+        self.assertEqual(shards[1], ['id,title\r\n', '2,Welcome to your new Wagtail site!\r\n'])
+        self.assertEqual(shards[2], ['id,title\r\n', '3,Page\r\n'])
+
+    def test_export_shard_resumed_after_cursor(self):
+        home = Page.objects.get(pk=2)
+        for i in range(5):
+            home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+
+        shard = list(export_pages(home, fieldnames=['id'], shard=(0, 2), with_cursor=True))
+        self.assertEqual([row.split(',')[0] for row in shard[1:]], ['2', '3', '4'])
+        after = decode_cursor(shard[1].rstrip().split(',')[1])
+        resumed = list(export_pages(home, fieldnames=['id'], shard=(0, 2),
+                                    with_cursor=True, after=after))
+        self.assertEqual(resumed, [shard[0]] + shard[2:])
+
+    def test_decode_invalid_cursor(self):
+        for cursor in ['', 'not base64!', encode_cursor('0001000'), encode_cursor('0001abcd')]:
+            with self.assertRaises(ValueError, msg=cursor):
+                decode_cursor(cursor)
+
     def test_export_only_published(self):
         page1 = SimplePage(
             bool_field=False,
@@ -257,3 +674,373 @@ class ExportingTests(TestCase):
                 'show_in_menus',
             ]
         )
+
+
+class PageURLResolverTests(TestCase):
+
+    def setUp(self):
+        root = Page.objects.get(depth=1)
+        home = Page.objects.get(slug='home')
+        section = home.add_child(instance=SimplePage(title='Section', int_field=1))
+        section.add_child(instance=SimplePage(title='Café', slug='café', int_field=2))
+        section.add_child(instance=SimplePage(title='Nested', int_field=3))
+        other_root = root.add_child(instance=Page(title='Other site'))
+        other_root.add_child(instance=SimplePage(title='Other page', int_field=4))
+        root.add_child(instance=Page(title='Not routable'))
+        Site.objects.create(hostname='other.test', port=8080, root_page=other_root)
+        Site.objects.create(hostname='section.test', root_page=section)
+
+    def assertSameURLs(self, pages):
+        resolver = PageURLResolver()
+        for page in pages:
+            self.assertEqual(resolver.get_full_url(page), page.full_url, page.url_path)
+
+    def test_same_as_page_full_url(self):
+        self.assertSameURLs(Page.objects.all())
+
+    def test_same_as_page_full_url_specific_pages(self):
+        self.assertSameURLs(Page.objects.specific())
+
+    def test_same_as_page_full_url_without_append_slash(self):
+        with mock.patch('wagtailcsvimport.exporting.WAGTAIL_APPEND_SLASH', False), \
+                mock.patch('wagtail.core.models.WAGTAIL_APPEND_SLASH', False):
+            self.assertSameURLs(Page.objects.all())
+
+    def test_site_root_paths_with_language_code(self):
+        # Wagtail 2.11+ returns (site_id, root_path, root_url, language_code)
+        site_root_paths = [srp[:3] + ('en',) for srp in Site.get_site_root_paths()]
+        with mock.patch.object(Site, 'get_site_root_paths', return_value=site_root_paths):
+            resolver = PageURLResolver()
+        page = Page.objects.get(slug='café')
+        self.assertEqual(resolver.get_full_url(page), 'http://section.test/caf%C3%A9/')
+
+    @override_settings(WAGTAIL_I18N_ENABLED=True)
+    def test_i18n_uses_page_full_url(self):
+        page = Page.objects.get(slug='nested')
+        resolver = PageURLResolver()
+        with mock.patch.object(Page, 'full_url', new_callable=mock.PropertyMock) as full_url:
+            full_url.return_value = 'http://section.test/en/nested/'
+            self.assertEqual(resolver.get_full_url(page), 'http://section.test/en/nested/')
+
+    def test_no_queries_per_page(self):
+        pages = list(Page.objects.all())
+        resolver = PageURLResolver()
+        with self.assertNumQueries(0):
+            urls = [resolver.get_full_url(page) for page in pages]
+        self.assertIn('http://section.test/caf%C3%A9/', urls)
+        self.assertIn('http://other.test:8080/other-page/', urls)
+        self.assertIn(None, urls)
+
+
+class ParallelExportTests(TestCase):
+
+    def setUp(self):
+        home = Page.objects.get(pk=2)
+        for i in range(3):
+            section = home.add_child(instance=SimplePage(title=f'Section {i}', int_field=i))
+            section.add_child(instance=M2MPage(title=f'Child {i}', fk=section))
+
+    def test_get_path_ranges(self):
+        pages = Page.objects.descendant_of(Page.objects.get(pk=2), inclusive=True)
+        self.assertEqual(
+            get_path_ranges(pages, 3),
+            [
+                (None, '000100010002'),
+                ('000100010002', '0001000100030001'),
+                ('0001000100030001', None),
+            ]
+        )
+        self.assertEqual(get_path_ranges(pages, 7), [(None, None)])
+
+    def test_same_rows_as_export_pages(self):
+        home = Page.objects.get(pk=2)
+        ct = ContentType.objects.get_for_model(SimplePage)
+        for kwargs in [{}, {'specific': True}, {'content_type': ct},
+                       {'fieldnames': ['id', 'parent', 'title'], 'only_published': False},
+                       {'after': '00010001', 'with_cursor': True},
+                       {'shard': (1, 2), 'specific': True}]:
+            with mock.patch('wagtailcsvimport.exporting.EXPORT_SHARD_SIZE', 2):
+                shards = list(export_pages_parallel(home, workers=1, **kwargs))
+            self.assertEqual(''.join(shards), ''.join(export_pages(home, **kwargs)), kwargs)
+
+    def test_shards_are_yielded_in_tree_order(self):
+        home = Page.objects.get(pk=2)
+        with mock.patch('wagtailcsvimport.exporting.EXPORT_SHARD_SIZE', 3):
+            shards = list(export_pages_parallel(home, fieldnames=['id', 'title'], workers=1))
+        self.assertEqual(
+            shards,
+            [
+                'id,title\r\n',
+                '2,Welcome to your new Wagtail site!\r\n3,Section 0\r\n4,Child 0\r\n',
+                '5,Section 1\r\n6,Child 1\r\n7,Section 2\r\n',
+                '8,Child 2\r\n',
+            ]
+        )
+
+
+@skipUnless(multiprocessing.get_start_method() == 'fork',
+            'worker processes need to inherit the test DB')
+class ParallelExportProcessPoolTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def test_same_rows_as_export_pages(self):
+        home = Page.objects.get(pk=2)
+        for i in range(7):
+            home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+
+        with mock.patch('wagtailcsvimport.exporting.EXPORT_SHARD_SIZE', 2):
+            shards = list(export_pages_parallel(home, specific=True, workers=2))
+        self.assertEqual(len(shards), 5)
+        self.assertEqual(''.join(shards), ''.join(export_pages(home, specific=True)))
+
+
+@override_settings(WAGTAILCSVIMPORT_EXPORT_DATABASE='replica')
+class ReplicaExportTests(TestCase):
+    # replica is a mirror of the default DB with its own connection,
+    # which can't see data written by the test, so only the pages
+    # created by migrations are exported
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        ContentType.objects.clear_cache()
+
+    def test_all_queries_use_replica(self):
+        home = Page.objects.get(pk=2)
+        with CaptureQueriesContext(connections['default']) as default_queries, \
+                CaptureQueriesContext(connections['replica']) as replica_queries:
+            rows = list(export_pages(home, fieldnames=['id', 'content_type', 'parent', 'title'],
+                                     specific=True))
+        self.assertEqual(
+            rows,
+            ['id,content_type,parent,title\r\n', '2,wagtailcore.page,1,Welcome to your new Wagtail site!\r\n']
+        )
+        self.assertEqual(len(default_queries), 0)
+        # content type ids and their content type, pages, specific
+        # pages and parents
+        self.assertEqual(len(replica_queries), 5)
+
+    def test_m2m_uses_replica(self):
+        plan = ExportPlan(M2MPage, ['id', 'm2m'], using='replica')
+        with CaptureQueriesContext(connections['default']) as default_queries, \
+                CaptureQueriesContext(connections['replica']) as replica_queries:
+            rows = list(plan.get_rows([M2MPage(id=42, page_ptr_id=42, path='000100010001', depth=3)]))
+        self.assertEqual(rows, [[42, '']])
+        self.assertEqual(len(default_queries), 0)
+        self.assertEqual(len(replica_queries), 1)
+
+    def test_parallel_export_uses_replica(self):
+        home = Page.objects.get(pk=1)
+        with mock.patch('wagtailcsvimport.exporting.EXPORT_SHARD_SIZE', 1), \
+                CaptureQueriesContext(connections['default']) as default_queries:
+            shards = list(export_pages_parallel(home, fieldnames=['id', 'parent'],
+                                                only_published=False, workers=1))
+        self.assertEqual(shards, ['id,parent\r\n', '1,\r\n', '2,1\r\n'])
+        self.assertEqual(len(default_queries), 0)
+
+
+@override_settings(WAGTAILCSVIMPORT_EXPORT_ROWS_TABLE=True)
+class ExportRowsTableTests(TestCase):
+
+    def setUp(self):
+        self.home = Page.objects.get(pk=2)
+        self.section = self.home.add_child(instance=SimplePage(
+            title='Section', int_field=1, bool_field=False,
+            first_published_at=pytz.datetime.datetime(2019, 1, 1, 12, tzinfo=pytz.UTC),
+        ))
+        self.m2m_page = self.section.add_child(instance=M2MPage(title='M2M page', fk=self.section))
+        self.m2m_page.m2m.add(self.section)
+
+    def test_same_rows_as_serializing_pages(self):
+        ct = ContentType.objects.get_for_model(SimplePage)
+        for kwargs in [{}, {'specific': True}, {'content_type': ct},
+                       {'fieldnames': ['id', 'parent', 'title'], 'only_published': False},
+                       {'specific': True, 'with_cursor': True}]:
+            rows = list(export_pages(self.home, **kwargs))
+            with override_settings(WAGTAILCSVIMPORT_EXPORT_ROWS_TABLE=False):
+                self.assertEqual(rows, list(export_pages(self.home, **kwargs)), kwargs)
+
+    def test_rows_are_saved_with_pages(self):
+        self.assertEqual(
+            sorted(ExportRow.objects.values_list('page_id', flat=True)),
+            [self.section.pk, self.m2m_page.pk]
+        )
+        # page types and rows
+        with self.assertNumQueries(2):
+            rows = list(export_pages(self.section, fieldnames=['id', 'title', 'fk', 'm2m'],
+                                     specific=True))
+        self.assertEqual(rows, ['id,title,fk,m2m\r\n', '3,Section,,\r\n', '4,M2M page,3,3\r\n'])
+
+    def test_rows_are_updated(self):
+        self.section.title = 'New title'
+        self.section.save()
+        self.m2m_page.m2m.clear()
+        rows = list(export_pages(self.section, fieldnames=['id', 'title', 'm2m'], specific=True))
+        self.assertEqual(rows, ['id,title,m2m\r\n', '3,New title,\r\n', '4,M2M page,\r\n'])
+
+        self.section.unpublish()
+        rows = list(export_pages(self.section, fieldnames=['id', 'live'],
+                                 only_published=False, specific=True))
+        self.assertEqual(rows, ['id,live\r\n', '3,False\r\n', '4,True\r\n'])
+
+    def test_full_urls_of_descendants_are_updated(self):
+        self.section.slug = 'new-slug'
+        self.section.save()
+        rows = list(export_pages(self.section, fieldnames=['id', 'full_url'], specific=True))
+        self.assertEqual(
+            rows,
+            [
+                'id,full_url\r\n',
+                '3,http://localhost/new-slug/\r\n',
+                '4,http://localhost/new-slug/m2m-page/\r\n',
+            ]
+        )
+
+    def test_rows_are_updated_when_m2m_is_cleared_in_reverse(self):
+        # M2MPage.m2m has no reverse accessor, send the same signals as
+        # the related manager of a reverse relation does on clear()
+        through = M2MPage.m2m.through
+        signal_kwargs = {'sender': through, 'instance': self.section, 'reverse': True,
+                         'model': M2MPage, 'pk_set': None}
+        m2m_changed.send(action='pre_clear', **signal_kwargs)
+        through.objects.filter(simplepage=self.section).delete()
+        m2m_changed.send(action='post_clear', **signal_kwargs)
+
+        rows = list(export_pages(self.section, fieldnames=['id', 'm2m'], specific=True))
+        self.assertEqual(rows, ['id,m2m\r\n', '3,\r\n', '4,\r\n'])
+
+    def test_full_urls_are_updated_when_sites_change(self):
+        def get_urls():
+            return list(export_pages(self.section, fieldnames=['id', 'full_url'], specific=True))
+
+        # Wagtail caches the root paths of sites, which outlive the test
+        self.addCleanup(cache.delete, 'wagtail_site_root_paths')
+        site = Site.objects.get(is_default_site=True)
+        site.hostname = 'example.test'
+        site.save()
+        self.assertEqual(get_urls(), ['id,full_url\r\n', '3,http://example.test/section/\r\n',
+                                      '4,http://example.test/section/m2m-page/\r\n'])
+
+        section_site = Site.objects.create(hostname='section.test', root_page=self.section)
+        self.assertEqual(get_urls(), ['id,full_url\r\n', '3,http://section.test/\r\n',
+                                      '4,http://section.test/m2m-page/\r\n'])
+
+        section_site.root_page = self.m2m_page
+        section_site.save()
+        self.assertEqual(get_urls(), ['id,full_url\r\n', '3,http://example.test/section/\r\n',
+                                      '4,http://section.test/\r\n'])
+
+        section_site.delete()
+        self.assertEqual(get_urls(), ['id,full_url\r\n', '3,http://example.test/section/\r\n',
+                                      '4,http://example.test/section/m2m-page/\r\n'])
+
+    def test_rows_are_updated_when_exportable_fields_change(self):
+        self.addCleanup(get_exportable_fields_for_model.cache_clear)
+        self.addCleanup(get_generated_fields_for_model.cache_clear)
+        patcher = mock.patch.dict('wagtailcsvimport.exporting.MODEL_GENERATED_FIELDS', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        register_generated_field(SimplePage, 'double_int',
+                                 lambda pages: {page.pk: page.int_field * 2 for page in pages},
+                                 fields=['int_field'])
+        ct = ContentType.objects.get_for_model(SimplePage)
+        rows = list(export_pages(self.section, content_type=ct, fieldnames=['id', 'double_int']))
+        self.assertEqual(rows, ['id,double_int\r\n', '3,2\r\n'])
+        # only the row of the page with the new field is serialized again
+        self.assertIn('double_int', json.loads(ExportRow.objects.get(page=self.section).data))
+        self.assertNotIn('double_int', json.loads(ExportRow.objects.get(page=self.m2m_page).data))
+
+    def test_rows_inserted_concurrently_are_kept(self):
+        # another export inserts the row after this one deleted it
+        ExportRow.objects.filter(page=self.m2m_page).update(data='{"title": "Concurrent"}')
+        with mock.patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            data = update_export_rows([self.m2m_page.pk])
+        self.assertEqual(json.loads(data[self.m2m_page.pk])['title'], 'M2M page')
+        self.assertEqual(ExportRow.objects.get(page=self.m2m_page).data, '{"title": "Concurrent"}')
+
+    def test_missing_rows_are_created(self):
+        ExportRow.objects.filter(page=self.m2m_page).delete()
+        with override_settings(WAGTAILCSVIMPORT_EXPORT_ROWS_TABLE=False):
+            self.home.add_child(instance=SimplePage(title='Not in table', int_field=2))
+
+        rows = list(export_pages(self.home, fieldnames=['id', 'title'], specific=True))
+        self.assertEqual(rows, ['id,title\r\n', '2,Welcome to your new Wagtail site!\r\n',
+                                '3,Section\r\n', '4,M2M page\r\n', '5,Not in table\r\n'])
+        self.assertEqual(ExportRow.objects.count(), 4)
+
+
+class GeneratedFieldTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(get_exportable_fields_for_model.cache_clear)
+        self.addCleanup(get_generated_fields_for_model.cache_clear)
+        patcher = mock.patch.dict('wagtailcsvimport.exporting.MODEL_GENERATED_FIELDS', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.home = Page.objects.get(pk=2)
+        self.simple_pages = [
+            self.home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+            for i in range(3)
+        ]
+
+    def test_resolver_is_called_once_per_chunk(self):
+        resolved = []
+
+        @register_generated_field(SimplePage, 'double_int', fields=['int_field'])
+        def get_double_int(pages):
+            resolved.append([page.pk for page in pages])
+            return {page.pk: page.int_field * 2 for page in pages}
+
+        self.assertIn('double_int', get_exportable_fields_for_model(SimplePage))
+        self.assertNotIn('double_int', get_exportable_fields_for_model(M2MPage))
+
+        ct = ContentType.objects.get_for_model(SimplePage)
+        with mock.patch('wagtailcsvimport.exporting.EXPORT_CHUNK_SIZE', 2), \
+                self.assertNumQueries(2):
+            rows = list(export_pages(self.home, content_type=ct,
+                                     fieldnames=['id', 'double_int']))
+        self.assertEqual(rows, ['id,double_int\r\n', '3,0\r\n', '4,2\r\n', '5,4\r\n'])
+        self.assertEqual(resolved, [[3, 4], [5]])
+
+    def test_inherited_by_subclasses(self):
+        register_generated_field(Page, 'title_length',
+                                 lambda pages: {page.pk: len(page.title) for page in pages},
+                                 verbose_name='Title length', fields=['title'])
+        self.home.add_child(instance=M2MPage(title='M2M page'))
+
+        self.assertIn('title_length', get_exportable_fields_for_model(M2MPage))
+        rows = list(export_pages(self.home, fieldnames=['id', 'title_length'], specific=True))
+        self.assertEqual(
+            rows,
+            ['id,title_length\r\n', '2,33\r\n', '3,6\r\n', '4,6\r\n', '5,6\r\n', '6,8\r\n']
+        )
+
+    def test_resolver_with_related_data_constant_queries(self):
+        @register_generated_field(M2MPage, 'm2m_titles')
+        def get_m2m_titles(pages):
+            titles = {}
+            through = M2MPage.m2m.through.objects.filter(m2mpage__in=pages)\
+                                                 .order_by('simplepage__path')
+            for page_id, title in through.values_list('m2mpage', 'simplepage__title'):
+                titles.setdefault(page_id, []).append(title)
+            return {page_id: ', '.join(page_titles) for page_id, page_titles in titles.items()}
+
+        for i in range(4):
+            page = self.home.add_child(instance=M2MPage(title=f'M2M page {i}'))
+            page.m2m.set(self.simple_pages[:i])
+
+        ct = ContentType.objects.get_for_model(M2MPage)
+        with self.assertNumQueries(2):
+            rows = list(export_pages(self.home, content_type=ct,
+                                     fieldnames=['title', 'm2m_titles']))
+        self.assertEqual(
+            rows,
+            [
+                'title,m2m_titles\r\n',
+                'M2M page 0,\r\n',
+                'M2M page 1,Page 0\r\n',
+                'M2M page 2,"Page 0, Page 1"\r\n',
+                'M2M page 3,"Page 0, Page 1, Page 2"\r\n',
+            ]
+        )
@@ -30,6 +30,27 @@ class ExportFormTests(TestCase):
         self.assertEqual(form.cleaned_data['only_published'], False)
         self.assertEqual(form.cleaned_data['fields'], ['id', 'title', 'int_field'])
 
+    def test_other_root_pages(self):
+        from wagtailcsvimport.forms import ExportForm
+        home = Page.objects.get(pk=2)
+        page = home.add_child(instance=Page(title='Test page'))
+        data = {
+            'fields': ['id'],
+            'root_page': home.pk,
+            'other_root_pages': f' {page.pk}, 1 ',
+        }
+        form = ExportForm(data)
+        self.assertEqual(form.errors, {})
+        self.assertEqual(form.get_root_pages(), [home, Page.objects.get(pk=1), page])
+
+        form = ExportForm({**data, 'other_root_pages': '42'})
+        self.assertIn('other_root_pages', form.errors)
+        with self.assertRaises(ValueError):
+            form.get_root_pages()
+
+        with self.assertRaises(ValueError):
+            ExportForm().get_root_pages()
+
     def test_fields_no_specific_page_model(self):
         from wagtailcsvimport.forms import ExportForm
         form = ExportForm()
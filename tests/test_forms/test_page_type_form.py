@@ -2,6 +2,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
 from wagtail.core.models import Page
 
+from tests.models import M2MPage
 from tests.models import NotAPage
 from tests.models import SimplePage
 
@@ -15,8 +16,8 @@ class PageTypeFormTests(TestCase):
             form.fields['page_type'].choices,
             [
                 (1, 'Page'),
-                (7, 'M2M page'),
-                (6, 'Simple page'),
+                (ContentType.objects.get_for_model(M2MPage).pk, 'M2M page'),
+                (ContentType.objects.get_for_model(SimplePage).pk, 'Simple page'),
             ]
         )
 
@@ -1,12 +1,20 @@
 # coding: utf-8
 from io import BytesIO
 from io import StringIO
+from unittest import mock
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 import pytz
 
 from wagtail.core.models import Page
 
+from wagtailcsvimport.exporting import DATETIME_FORMAT
+from wagtailcsvimport.exporting import get_exportable_fields_for_model
+from wagtailcsvimport.exporting import get_generated_fields_for_model
+from wagtailcsvimport.exporting import register_generated_field
+from wagtailcsvimport import importing
 from wagtailcsvimport.importing import import_pages
 
 from tests.models import M2MPage
@@ -28,6 +36,28 @@ class ImportingTests(TestCase):
             ["Error(Error in CSV header: Unrecognized fields: ['depth', 'numchild', 'page_ptr', 'path', 'url_path'])"]
         )
 
+    def test_import_ignores_cursor_column(self):
+        csv_data = StringIO(
+            'id,parent,title,int_field,_cursor\r\n'
+            ',2,Test page,42,MDAwMTAwMDEwMDAx\r\n'
+        )
+        successes, errors = import_pages(csv_data, SimplePage)
+        self.assertEqual(successes, ['Created page Test page with id 3'])
+        self.assertEqual(errors, [])
+
+    def test_import_ignores_generated_fields(self):
+        self.addCleanup(get_exportable_fields_for_model.cache_clear)
+        self.addCleanup(get_generated_fields_for_model.cache_clear)
+        with mock.patch.dict('wagtailcsvimport.exporting.MODEL_GENERATED_FIELDS', {}):
+            register_generated_field(SimplePage, 'double_int', lambda pages: {})
+            csv_data = StringIO(
+                'id,parent,title,int_field,double_int\r\n'
+                ',2,Test page,42,84\r\n'
+            )
+            successes, errors = import_pages(csv_data, SimplePage)
+        self.assertEqual(successes, ['Created page Test page with id 3'])
+        self.assertEqual(errors, [])
+
     def test_create_complex_page_with_foreign_key(self):
         simple_page = SimplePage(
             title='Test Page',
@@ -393,3 +423,302 @@ class ImportingTests(TestCase):
             [repr(e) for e in errors],
             ["Error(File is not valid CSV)"]
         )
+
+    def test_bulk_create_pages(self):
+        home = Page.objects.get(slug='home')
+        home.add_child(instance=SimplePage(title='Existing Page', slug='existing', int_field=1))
+
+        csv_data = StringIO(
+            'id,parent,title,slug,int_field\r\n'
+            ',2,First Page,,42\r\n'
+            '3,2,Updated Existing Page,existing,2\r\n'
+            ',3,Child Page,,27\r\n'
+            ',2,Second Page,existing,7\r\n'
+            ',2,Third Page,,\r\n'
+            ',2,Fourth Page,,79\r\n'
+        )
+        successes, errors = import_pages(csv_data, SimplePage, bulk_create=True)
+        self.assertEqual(
+            successes,
+            ['Updated page Updated Existing Page with id 3',
+             'Created page First Page with id 4',
+             'Created page Child Page with id 5',
+             'Created page Fourth Page with id 6'],
+        )
+        self.assertEqual(
+            [repr(e) for e in errors],
+            ["Error(Errors processing row number 5: {'int_field': [ValidationError(['This field is required.'])]})",
+             "Error(Errors processing row number 4: {'slug': ['This slug is already in use']})"]
+        )
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+        self.assertQuerysetEqual(
+            SimplePage.objects.order_by('path').values_list('title', 'int_field', 'url_path', 'live'),
+            [('Updated Existing Page', 2, '/home/existing/', True),
+             ('Child Page', 27, '/home/existing/child-page/', False),
+             ('First Page', 42, '/home/first-page/', False),
+             ('Fourth Page', 79, '/home/fourth-page/', False)],
+            transform=tuple
+        )
+        self.assertEqual(Page.objects.get(pk=2).numchild, 3)
+        self.assertEqual(Page.objects.get(pk=3).numchild, 1)
+
+    def test_bulk_create_pages_does_not_read_all_siblings(self):
+        home = Page.objects.get(slug='home')
+        for i in range(3):
+            home.add_child(instance=SimplePage(title=f'Existing Page {i}', int_field=i))
+
+        csv_data = StringIO(
+            'id,parent,title,slug,int_field\r\n'
+            ',2,New Page,,42\r\n'
+            ',2,Another Page,existing-page-1,27\r\n'
+        )
+        with CaptureQueriesContext(connection) as queries:
+            successes, errors = import_pages(csv_data, SimplePage, bulk_create=True)
+        self.assertEqual(successes, ['Created page New Page with id 6'])
+        self.assertEqual(
+            [str(e) for e in errors],
+            ["Errors processing row number 2: {'slug': ['This slug is already in use']}"]
+        )
+        self.assertEqual(Page.objects.get(pk=6).path, '000100010004')
+        sibling_queries = [q['sql'] for q in queries
+                           if q['sql'].startswith('SELECT') and '"wagtailcore_page"."depth" = 3' in q['sql']]
+        self.assertEqual(len(sibling_queries), 2)
+        self.assertIn('LIMIT 1', sibling_queries[0])
+        self.assertIn('"wagtailcore_page"."slug" IN (', sibling_queries[1])
+
+    def test_bulk_create_page_with_m2m(self):
+        home = Page.objects.get(slug='home')
+        home.add_child(instance=SimplePage(title='Test Page', int_field=42))
+        home.add_child(instance=SimplePage(title='Another Test Page', int_field=27))
+
+        csv_data = StringIO(
+            'id,parent,title,fk,m2m\r\n'
+            ',2,Page with M2M,3,"3,4"\r\n'
+        )
+        successes, errors = import_pages(csv_data, M2MPage, bulk_create=True)
+        self.assertEqual(successes, ['Created page Page with M2M with id 5'])
+        self.assertEqual(errors, [])
+        page = M2MPage.objects.get(pk=5)
+        self.assertEqual(page.get_parent().id, home.pk)
+        self.assertEqual(page.fk_id, 3)
+        self.assertQuerysetEqual(
+            page.m2m.order_by('id'),
+            ['<SimplePage: Test Page>', '<SimplePage: Another Test Page>']
+        )
+
+    def test_update_error_page_does_not_exist(self):
+        csv_data = StringIO(
+            'id,title\r\n'
+            '42,Missing Page\r\n'
+            'wrong,Wrong Page\r\n'
+            '2,Updated Home\r\n'
+        )
+        successes, errors = import_pages(csv_data, Page)
+        self.assertEqual(successes, ['Updated page Updated Home with id 2'])
+        self.assertEqual(
+            [repr(e) for e in errors],
+            ["Error(Errors processing row number 1: {'id': ['Page with id 42 does not exist']})",
+             "Error(Errors processing row number 2: {'id': ['Page with id wrong does not exist']})"]
+        )
+
+    def test_update_pages_fetched_by_chunks(self):
+        home = Page.objects.get(slug='home')
+        for title in ['First', 'Second', 'Third']:
+            home.add_child(instance=SimplePage(title=title, int_field=1))
+
+        csv_data = StringIO(
+            'id,int_field\r\n'
+            '3,10\r\n'
+            '4,20\r\n'
+            '5,30\r\n'
+        )
+        with mock.patch('wagtailcsvimport.importing.IMPORT_CHUNK_SIZE', 2), \
+                mock.patch('wagtailcsvimport.importing.get_existing_pages',
+                           wraps=importing.get_existing_pages) as get_existing_pages:
+            successes, errors = import_pages(csv_data, SimplePage)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(successes), 3)
+        self.assertEqual(get_existing_pages.call_count, 2)
+        self.assertQuerysetEqual(
+            SimplePage.objects.order_by('id').values_list('int_field', flat=True),
+            [10, 20, 30], transform=int
+        )
+
+    def test_update_same_page_twice_in_a_chunk(self):
+        home = Page.objects.get(slug='home')
+        home.add_child(instance=SimplePage(title='First', int_field=1))
+        home.add_child(instance=SimplePage(title='Second', int_field=2))
+
+        # the form of the first row sets int_field on its instance
+        # before failing on the slug
+        csv_data = StringIO(
+            'id,slug,int_field\r\n'
+            '3,second,10\r\n'
+            '3,first,20\r\n'
+        )
+        instances = []
+        form_init = importing.PageModelForm.__init__
+
+        def record_instance(form, *args, **kwargs):
+            form_init(form, *args, **kwargs)
+            instances.append((form.instance, form.instance.slug, form.instance.int_field))
+
+        with mock.patch.object(importing.PageModelForm, '__init__', record_instance):
+            successes, errors = import_pages(csv_data, SimplePage)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(successes, ['Updated page First with id 3'])
+        [(first, _, _), (second, slug, int_field)] = instances
+        self.assertIsNot(first, second)
+        # the second row sees the page as it is in the database
+        self.assertEqual((slug, int_field), ('first', 1))
+        self.assertEqual(SimplePage.objects.get(pk=3).int_field, 20)
+
+    def test_resolved_references(self):
+        home = Page.objects.get(slug='home')
+        home.add_child(instance=SimplePage(title='Test Page', int_field=42))
+        home.add_child(instance=SimplePage(title='Another Test Page', int_field=27))
+        rows = [
+            {'parent': '2', 'title': 'Valid', 'fk': '3', 'm2m': '3,4'},
+            {'parent': '42', 'title': 'Wrong parent', 'fk': '2', 'm2m': '3,42'},
+            {'parent': 'wrong', 'title': 'Wrong ids', 'fk': 'wrong', 'm2m': 'wrong'},
+            {'parent': '2', 'title': 'Missing and wrong ids', 'fk': '3', 'm2m': '42,wrong'},
+        ]
+        form_class = importing.get_form_class(M2MPage, ['parent', 'title', 'fk', 'm2m'])
+        with self.assertNumQueries(3):
+            references = importing.resolve_references(rows, form_class)
+        self.assertEqual(set(references['parent']), {2})
+        self.assertEqual(set(references['fk']), {3})
+        self.assertEqual(set(references['m2m']), {3, 4})
+
+        for row in rows:
+            form = form_class(row, references=references)
+            with self.assertNumQueries(0):
+                is_valid = form.is_valid()
+            # same errors as without the references
+            unresolved_form = form_class(row)
+            self.assertEqual(is_valid, unresolved_form.is_valid())
+            self.assertEqual(form.errors, unresolved_form.errors)
+        form = form_class(rows[0], references=references)
+        form.is_valid()
+        self.assertEqual(form.cleaned_data['fk'].pk, 3)
+        self.assertEqual([p.pk for p in form.cleaned_data['m2m']], [3, 4])
+
+    def test_import_plan_is_cached(self):
+        fieldnames = ('id', 'parent', 'title', 'int_field')
+        plan = importing.get_import_plan(SimplePage, fieldnames)
+        self.assertIs(importing.get_import_plan(SimplePage, fieldnames), plan)
+        self.assertIsNone(plan.header_error)
+        fields = plan.form_class.base_fields
+        self.assertIsInstance(fields['title'], importing.CSVCharField)
+        self.assertIsInstance(fields['int_field'], importing.CSVIntegerField)
+        self.assertTrue(fields['title'].fast_path)
+        self.assertTrue(fields['int_field'].fast_path)
+        # simple fields are shared by all forms
+        self.assertIs(plan.form_class().fields['title'], fields['title'])
+        self.assertIsNot(plan.form_class().fields['parent'], fields['parent'])
+
+    def test_fast_fields_clean_like_regular_fields(self):
+        from django import forms
+        cases = [
+            (importing.CSVCharField(max_length=5), forms.CharField(max_length=5),
+             ['abc', ' abc ', '', '   ', 'abcdef', 'a\x00b']),
+            (importing.CSVCharField(required=False), forms.CharField(required=False),
+             ['abc', '']),
+            (importing.CSVIntegerField(min_value=0, max_value=100), forms.IntegerField(min_value=0, max_value=100),
+             ['42', ' 42 ', '42.0', '', '-1', '101', 'abc', '1e3']),
+            (importing.CSVDateTimeField(), forms.DateTimeField(),
+             ['2019-03-01 12:30:45', ' 2019-03-01 12:30:45', '2019-02-30 12:30:45',
+              '2019-03-01 12:30', '2019-03-01', 'yesterday', '']),
+        ]
+        for fast_field, regular_field, values in cases:
+            for value in values:
+                with self.subTest(field=type(regular_field).__name__, value=value):
+                    try:
+                        expected = regular_field.clean(value)
+                    except forms.ValidationError as e:
+                        with self.assertRaises(forms.ValidationError) as cm:
+                            fast_field.clean(value)
+                        self.assertEqual(cm.exception.messages, e.messages)
+                    else:
+                        self.assertEqual(fast_field.clean(value), expected)
+
+    def test_datetime_field_iterable_input_formats(self):
+        # like Django 3.1+ DateTimeFormatsIterator, which can't be indexed
+        class InputFormats:
+            def __iter__(self):
+                yield DATETIME_FORMAT
+                yield '%d/%m/%Y %H:%M'
+
+        field = importing.CSVDateTimeField(input_formats=InputFormats())
+        self.assertEqual(field.first_input_format, DATETIME_FORMAT)
+        self.assertEqual(
+            field.clean('2019-03-01 12:30:45'),
+            pytz.datetime.datetime(2019, 3, 1, 12, 30, 45, tzinfo=pytz.UTC)
+        )
+        self.assertEqual(
+            field.clean('01/03/2019 12:30'),
+            pytz.datetime.datetime(2019, 3, 1, 12, 30, tzinfo=pytz.UTC)
+        )
+
+    def test_decode_lines(self):
+        csv_data = BytesIO(
+            'id,parent,title,seo_title,int_field\r\n'
+            ',2,Première page,"Two\r\nlines",42\r\n'.encode('utf-8')
+        )
+        successes, errors = import_pages(importing.decode_lines(csv_data), SimplePage)
+        self.assertEqual(successes, ['Created page Première page with id 3'])
+        self.assertEqual(errors, [])
+        self.assertEqual(SimplePage.objects.get(pk=3).seo_title, 'Two\r\nlines')
+
+    def test_decode_error_row_number(self):
+        csv_data = BytesIO(
+            b'id,parent,title,int_field\r\n'
+            b',2,First page,42\r\n'
+            b',2,Wrong \xe9ncoding,27\r\n'
+            b',2,Third page,79\r\n'
+        )
+        successes, errors = import_pages(importing.decode_lines(csv_data), SimplePage)
+        self.assertEqual(successes, ['Created page First page with id 3'])
+        self.assertEqual(
+            [str(e) for e in errors],
+            ["Error decoding row number 2, make sure it's an UTF-8 encoded CSV file: "
+             "'utf-8' codec can't decode byte 0xe9 in position 9: invalid continuation byte"]
+        )
+
+    def test_error_reading_row(self):
+        csv_data = StringIO(
+            'id,parent,title,int_field,rich_text_field\r\n'
+            ',2,First page,42,\r\n'
+            f',2,Huge page,27,"{"x" * 200000}"\r\n'
+            ',2,Third page,79,\r\n'
+        )
+        successes, errors = import_pages(csv_data, SimplePage)
+        self.assertEqual(successes, ['Created page First page with id 3'])
+        self.assertEqual(
+            [str(e) for e in errors],
+            ['Errors processing row number 2: field larger than field limit (131072)']
+        )
+
+    def test_resolved_references_limit_choices_to(self):
+        home = Page.objects.get(slug='home')
+        home.add_child(instance=SimplePage(title='Test Page', int_field=42))
+        home.add_child(instance=SimplePage(title='Another Test Page', int_field=27))
+        form_class = importing.get_form_class(M2MPage, ['parent', 'title', 'fk', 'm2m'])
+        form_class.base_fields['fk'].limit_choices_to = {'int_field': 42}
+        form_class.base_fields['m2m'].limit_choices_to = {'int_field': 42}
+        rows = [
+            {'parent': '2', 'title': 'Valid', 'fk': '3', 'm2m': '3'},
+            {'parent': '2', 'title': 'Not allowed', 'fk': '4', 'm2m': '3,4'},
+        ]
+        references = importing.resolve_references(rows, form_class)
+        self.assertEqual(set(references['fk']), {3})
+        self.assertEqual(set(references['m2m']), {3})
+
+        form = form_class(rows[0], references=references)
+        self.assertTrue(form.is_valid(), form.errors)
+        form = form_class(rows[1], references=references)
+        self.assertFalse(form.is_valid())
+        unresolved_form = form_class(rows[1])
+        self.assertFalse(unresolved_form.is_valid())
+        self.assertEqual(form.errors, unresolved_form.errors)
+        self.assertEqual(set(form.errors), {'fk', 'm2m'})
@@ -0,0 +1,175 @@
+from datetime import timedelta
+import gzip
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from django.test import override_settings
+from django.utils import timezone
+
+from wagtail.core.models import Page
+
+from wagtailcsvimport.jobs import run_export_job
+from wagtailcsvimport.models import ExportJob
+from wagtailcsvimport.models import get_worker_name
+
+from tests.models import SimplePage
+
+
+class ExportJobTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(WAGTAILCSVIMPORT_EXPORT_JOB_DIR=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.home = Page.objects.get(pk=2)
+        for i in range(3):
+            self.home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+
+    def test_run_export_job(self):
+        job = ExportJob.objects.create(
+            root_page=self.home,
+            content_type=ContentType.objects.get_for_model(SimplePage),
+            fieldnames='id,title,int_field',
+        )
+        with mock.patch('wagtailcsvimport.jobs.EXPORT_CHUNK_SIZE', 2):
+            run_export_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FINISHED)
+        self.assertEqual(job.total_rows, 3)
+        self.assertEqual(job.rows_done, 3)
+        self.assertEqual(job.progress, 100)
+        self.assertIsNotNone(job.finished_at)
+        self.assertRegex(job.file.name, rf'^wagtailcsvimport/exports/wagtail_export_{job.pk}_[\w-]{{22}}\.csv$')
+        self.assertTrue(job.file.path.startswith(self.media_root.name))
+        # files aren't public
+        with self.assertRaisesMessage(ValueError, 'This file is not accessible via a URL.'):
+            job.file.url
+        with job.file.open('rb') as f:
+            self.assertEqual(
+                f.read(),
+                b'id,title,int_field\r\n3,Page 0,0\r\n4,Page 1,1\r\n5,Page 2,2\r\n'
+            )
+
+    def test_run_export_job_compressed(self):
+        job = ExportJob.objects.create(root_page=self.home, fieldnames='id', compress=True)
+        run_export_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FINISHED)
+        self.assertTrue(job.file.name.endswith('.csv.gz'))
+        with job.file.open('rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), b'id\r\n2\r\n3\r\n4\r\n5\r\n')
+
+    def test_run_export_job_failed(self):
+        job = ExportJob.objects.create(root_page=self.home, fieldnames='id,not_a_field')
+        run_export_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertIn('not_a_field', job.error)
+        self.assertFalse(job.file)
+
+    def test_stale_jobs(self):
+        job = ExportJob.objects.create(root_page=self.home, fieldnames='id',
+                                       status=ExportJob.RUNNING, worker=get_worker_name(),
+                                       heartbeat_at=timezone.now())
+        self.assertFalse(job.is_stale)
+
+        # process of this host that doesn't exist
+        with mock.patch('os.kill', side_effect=ProcessLookupError):
+            self.assertTrue(job.is_stale)
+            job.fail_if_stale()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertEqual(job.error, 'The export was interrupted, please try again.')
+        self.assertFalse(job.is_stale)
+
+        # process of another host without recent progress
+        job = ExportJob.objects.create(root_page=self.home, fieldnames='id',
+                                       worker='otherhost:42', heartbeat_at=timezone.now())
+        self.assertFalse(job.is_stale)
+        job.heartbeat_at -= timedelta(hours=2)
+        self.assertTrue(job.is_stale)
+        with override_settings(WAGTAILCSVIMPORT_EXPORT_JOB_TIMEOUT=3 * 3600):
+            self.assertFalse(job.is_stale)
+
+    def test_progress_and_eta(self):
+        job = ExportJob(status=ExportJob.PENDING)
+        self.assertIsNone(job.progress)
+        self.assertIsNone(job.eta)
+
+        job = ExportJob(status=ExportJob.RUNNING, total_rows=400, rows_done=100,
+                        started_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(job.progress, 25)
+        self.assertAlmostEqual(job.eta.total_seconds(), 180, delta=1)
+
+
+class ExportJobViewTests(TestCase):
+    fixtures = ['testdata.json']
+
+    def setUp(self):
+        self.client.login(username='admin', password='admin')
+
+    def test_export_in_background(self):
+        data = {
+            'page_type': 1,
+            'fields': ['id', 'title'],
+            'root_page': 2,
+            'background': True,
+        }
+        with mock.patch('wagtailcsvimport.views.start_export_job') as start_export_job:
+            response = self.client.post('/admin/csv/export-to-file/', data)
+        job = ExportJob.objects.get()
+        start_export_job.assert_called_once_with(job)
+        self.assertRedirects(response, f'/admin/csv/export-jobs/{job.pk}/')
+        self.assertEqual(job.user, User.objects.get(username='admin'))
+        self.assertEqual(job.get_fieldnames(), ['id', 'title'])
+        self.assertEqual(job.status, ExportJob.PENDING)
+
+    def test_job_progress_page(self):
+        job = ExportJob.objects.create(
+            root_page_id=2, fieldnames='id', status=ExportJob.RUNNING,
+            total_rows=10, rows_done=5, started_at=timezone.now(),
+            worker=get_worker_name(),
+        )
+        response = self.client.get(f'/admin/csv/export-jobs/{job.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Exported 5 of 10 pages (50%)')
+        self.assertContains(response, '<meta http-equiv="refresh"')
+        self.assertNotContains(response, 'Download')
+
+        response = self.client.get(f'/admin/csv/export-jobs/{job.pk}/download/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_job_progress_page_stale_job(self):
+        job = ExportJob.objects.create(root_page_id=2, fieldnames='id', status=ExportJob.RUNNING,
+                                       worker='otherhost:42')
+        ExportJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(days=1))
+        response = self.client.get(f'/admin/csv/export-jobs/{job.pk}/')
+        self.assertContains(response, 'The export was interrupted, please try again.')
+        self.assertNotContains(response, '<meta http-equiv="refresh"')
+
+    def test_job_download(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(WAGTAILCSVIMPORT_EXPORT_JOB_DIR=media_root):
+            job = ExportJob.objects.create(root_page_id=2, fieldnames='id,title')
+            run_export_job(job.pk)
+
+            response = self.client.get(f'/admin/csv/export-jobs/{job.pk}/')
+            self.assertContains(response, f'href="/admin/csv/export-jobs/{job.pk}/download/"')
+            self.assertNotContains(response, '<meta http-equiv="refresh"')
+
+            response = self.client.get(f'/admin/csv/export-jobs/{job.pk}/download/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/csv')
+            self.assertEqual(response['Content-Disposition'],
+                             f'attachment; filename="wagtail_export_{job.pk}.csv"')
+            self.assertEqual(b''.join(response.streaming_content).splitlines()[0], b'id,title')
+            response.close()
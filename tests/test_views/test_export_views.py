@@ -1,10 +1,23 @@
+import gzip
 import io
+import os
+import tempfile
+from unittest import mock
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.test import TestCase
+from django.test import override_settings
+import pytz
 
 from wagtail.core.models import Page
+from wagtail.core.models import Site
 
+from wagtailcsvimport import importing
+from wagtailcsvimport.exporting import encode_cursor
+from wagtailcsvimport.exporting import export_pages_parallel
+
+from tests.models import M2MPage
 from tests.models import SimplePage
 
 
@@ -27,8 +40,10 @@ class ExportViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, b'<form action="/admin/csv/export-to-file/" method="GET"')
         self.assertContains(response, b'<option value="1">Page</option>')
-        self.assertContains(response, b'<option value="6">Simple page</option>')
-        self.assertContains(response, b'<option value="7">M2M page</option>')
+        simple_page_ct = ContentType.objects.get_for_model(SimplePage)
+        m2m_page_ct = ContentType.objects.get_for_model(M2MPage)
+        self.assertContains(response, f'<option value="{simple_page_ct.pk}">Simple page</option>')
+        self.assertContains(response, f'<option value="{m2m_page_ct.pk}">M2M page</option>')
         self.assertContains(response, b'<form action="/admin/csv/export-to-file/" method="POST"')
         self.assertContains(response, b'<input type="checkbox" name="fields" value="id" id="id_fields_0" checked>')
         self.assertContains(response, b'<input type="checkbox" name="fields" value="content_type" id="id_fields_1" checked>')
@@ -141,3 +156,288 @@ class ExportViewTests(TestCase):
         self.assertTrue(response.streaming)
         full_response = io.BytesIO(b''.join(response.streaming_content))
         self.assertEqual(full_response.getvalue(), b'id,content_type,title,int_field\r\n3,tests.simplepage,Test page,42\r\n')
+
+    def test_post_compressed(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Test page', int_field=42))
+
+        data = {
+            'compress': 'on',
+            'fields': ['id', 'title', 'int_field'],
+            'page_type': ContentType.objects.get_for_model(SimplePage).pk,
+            'root_page': home.pk,
+        }
+        response = self.client.post('/admin/csv/export-to-file/', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="wagtail_export.csv.gz"')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b'id,title,int_field\r\n3,Test page,42\r\n'
+        )
+
+    def test_post_with_other_root_pages(self):
+        home = Page.objects.get(pk=2)
+        pages = [home.add_child(instance=SimplePage(title=f'Page {i}', int_field=i))
+                 for i in range(3)]
+
+        data = {
+            'fields': ['id', 'title'],
+            'page_type': ContentType.objects.get_for_model(SimplePage).pk,
+            'root_page': pages[2].pk,
+            'other_root_pages': f'{pages[0].pk}',
+        }
+        response = self.client.post('/admin/csv/export-to-file/', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'id,title\r\n3,Page 0\r\n5,Page 2\r\n')
+
+    def test_post_streams_rows_in_blocks(self):
+        home = Page.objects.get(pk=2)
+        for i in range(3):
+            home.add_child(instance=SimplePage(title=f'Test page {i}', int_field=i))
+
+        data = {
+            'fields': ['id', 'title'],
+            'page_type': ContentType.objects.get_for_model(SimplePage).pk,
+            'root_page': home.pk,
+        }
+        response = self.client.post('/admin/csv/export-to-file/', data)
+        self.assertEqual(
+            list(response.streaming_content),
+            [b'id,title\r\n3,Test page 0\r\n4,Test page 1\r\n5,Test page 2\r\n']
+        )
+
+        with override_settings(WAGTAILCSVIMPORT_EXPORT_BUFFER_SIZE=25):
+            response = self.client.post('/admin/csv/export-to-file/', data)
+            self.assertEqual(
+                list(response.streaming_content),
+                [b'id,title\r\n3,Test page 0\r\n', b'4,Test page 1\r\n5,Test page 2\r\n']
+            )
+
+
+class ExportAPIViewTests(TestCase):
+    fixtures = ['testdata.json']
+
+    def setUp(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=Page(title='Test page', live=True))
+        self.expected_csv = (
+            b'id,content_type,parent,title,slug,full_url,live,draft_title,expire_at,expired,first_published_at,go_live_at,has_unpublished_changes,last_published_at,latest_revision_created_at,live_revision,locked,owner,search_description,seo_title,show_in_menus\r\n'
+            b'2,wagtailcore.page,1,Home,home,http://wagtailcsvimport.test/home/,True,,,False,,,False,,,,False,,,,False\r\n'
+            b'3,wagtailcore.page,2,Test page,test-page,http://wagtailcsvimport.test/home/test-page/,True,Test page,,False,,,False,,,,False,,,,False\r\n'
+        )
+
+    def test_export(self):
+        response = self.client.get('/csv/export/2/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.expected_csv)
+
+    def test_export_not_found(self):
+        response = self.client.get('/csv/export/42/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_gzip_content_encoding(self):
+        response = self.client.get('/csv/export/2/', HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.8')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.expected_csv)
+
+    def test_export_gzip_not_acceptable(self):
+        response = self.client.get('/csv/export/2/', HTTP_ACCEPT_ENCODING='gzip;q=0, br')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.expected_csv)
+
+    def test_export_csv_gz_file(self):
+        response = self.client.get('/csv/export/2/', {'format': 'csv.gz'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="wagtail_export.csv.gz"')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.expected_csv)
+
+    def test_export_specific(self):
+        home = Page.objects.get(pk=2)
+        home.add_child(instance=SimplePage(title='Simple page', int_field=42, live=True))
+
+        response = self.client.get('/csv/export/2/', {'specific': '1'})
+        self.assertEqual(response.status_code, 200)
+        rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(
+            rows[0],
+            b'id,content_type,parent,title,slug,full_url,live,bool_field,char_field,draft_title,expire_at,expired,first_published_at,go_live_at,has_unpublished_changes,int_field,last_published_at,latest_revision_created_at,live_revision,locked,owner,rich_text_field,search_description,seo_title,show_in_menus'
+        )
+        self.assertEqual(
+            rows[1:],
+            [
+                b'2,wagtailcore.page,1,Home,home,http://wagtailcsvimport.test/home/,True,,,,,False,,,False,,,,,False,,,,,False',
+                b'3,wagtailcore.page,2,Test page,test-page,http://wagtailcsvimport.test/home/test-page/,True,,,Test page,,False,,,False,,,,,False,,,,,False',
+                b'4,tests.simplepage,2,Simple page,simple-page,http://wagtailcsvimport.test/home/simple-page/,True,True,,Simple page,,False,,,False,42,,,,False,,,,,False',
+            ]
+        )
+
+    def test_export_etag_not_modified(self):
+        response = self.client.get('/csv/export/2/')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        b''.join(response.streaming_content)
+
+        # only the site, root page and the two version queries
+        with self.assertNumQueries(4):
+            response = self.client.get('/csv/export/2/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # parameters are part of the version
+        response = self.client.get('/csv/export/2/', {'specific': '1'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # adding a page changes the version
+        Page.objects.get(pk=2).add_child(instance=Page(title='New page', live=True))
+        response = self.client.get('/csv/export/2/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_export_etag_changes_with_pages(self):
+        def get_etag():
+            return self.client.get('/csv/export/2/')['ETag']
+
+        etag = get_etag()
+        # saved without publishing nor creating a revision
+        page = Page.objects.get(slug='test-page')
+        page.slug = 'new-slug'
+        page.save()
+        new_etag = get_etag()
+        self.assertNotEqual(new_etag, etag)
+
+        etag = new_etag
+        successes, errors = importing.import_pages(io.StringIO(
+            'id,title\r\n'
+            f'{page.pk},Imported title\r\n'
+        ), Page)
+        self.assertEqual(errors, [])
+        new_etag = get_etag()
+        self.assertNotEqual(new_etag, etag)
+
+        etag = new_etag
+        # Wagtail caches the root paths of sites, which outlive the test
+        self.addCleanup(cache.delete, 'wagtail_site_root_paths')
+        site = Site.objects.get(is_default_site=True)
+        site.port = 8080
+        site.save()
+        self.assertNotEqual(get_etag(), etag)
+
+    def test_export_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, \
+                override_settings(WAGTAILCSVIMPORT_EXPORT_SNAPSHOT_DIR=snapshot_dir):
+            response = self.client.get('/csv/export/2/')
+            self.assertEqual(os.listdir(snapshot_dir), [])
+            self.assertEqual(b''.join(response.streaming_content), self.expected_csv)
+            snapshots = os.listdir(snapshot_dir)
+            self.assertEqual(len(snapshots), 1)
+
+            # snapshot is served without exporting pages again, only
+            # the site, root page and the two version queries
+            with self.assertNumQueries(4):
+                response = self.client.get('/csv/export/2/', HTTP_ACCEPT_ENCODING='gzip')
+                content = b''.join(response.streaming_content)
+            self.assertEqual(gzip.decompress(content), self.expected_csv)
+
+            # a new version replaces the old snapshot
+            Page.objects.get(pk=3).delete()
+            response = self.client.get('/csv/export/2/')
+            content = b''.join(response.streaming_content)
+            self.assertEqual(content.count(b'\r\n'), 2)
+            self.assertNotIn(b'test-page', content)
+            new_snapshots = os.listdir(snapshot_dir)
+            self.assertEqual(len(new_snapshots), 1)
+            self.assertNotEqual(new_snapshots, snapshots)
+
+    def test_export_incomplete_snapshot_is_discarded(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, \
+                override_settings(WAGTAILCSVIMPORT_EXPORT_SNAPSHOT_DIR=snapshot_dir,
+                                  WAGTAILCSVIMPORT_EXPORT_BUFFER_SIZE=1):
+            response = self.client.get('/csv/export/2/')
+            next(response.streaming_content)
+            response.close()
+            self.assertEqual(os.listdir(snapshot_dir), [])
+
+    def test_export_since(self):
+        Page.objects.filter(pk=3).update(
+            last_published_at=pytz.datetime.datetime(2019, 3, 1, 12, tzinfo=pytz.UTC)
+        )
+        response = self.client.get('/csv/export/2/', {'since': '2019-03-01T11:00:00'})
+        self.assertEqual(response.status_code, 200)
+        rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith(b'3,wagtailcore.page,2,Test page,'))
+
+        response = self.client.get('/csv/export/2/', {'since': '2019-03-01T13:00:00+01:00'})
+        self.assertEqual(b''.join(response.streaming_content).count(b'\r\n'), 1)
+
+    def test_export_since_invalid(self):
+        for since in ['yesterday', '2019-13-01T00:00:00']:
+            response = self.client.get('/csv/export/2/', {'since': since})
+            self.assertEqual(response.status_code, 400)
+
+    def test_export_cursor(self):
+        response = self.client.get('/csv/export/2/', {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(rows[0].endswith(b',show_in_menus,_cursor'))
+        cursor = rows[1].rsplit(b',', 1)[1].decode()
+
+        response = self.client.get('/csv/export/2/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        resumed_rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(resumed_rows, [rows[0], rows[2]])
+
+    def test_export_cursor_invalid(self):
+        response = self.client.get('/csv/export/2/', {'cursor': 'not a cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_resumed_is_not_snapshotted(self):
+        cursor = encode_cursor('00010001')
+        with tempfile.TemporaryDirectory() as snapshot_dir, \
+                override_settings(WAGTAILCSVIMPORT_EXPORT_SNAPSHOT_DIR=snapshot_dir):
+            response = self.client.get('/csv/export/2/', {'cursor': cursor})
+            b''.join(response.streaming_content)
+            self.assertEqual(os.listdir(snapshot_dir), [])
+
+    def test_export_since_is_not_snapshotted(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir, \
+                override_settings(WAGTAILCSVIMPORT_EXPORT_SNAPSHOT_DIR=snapshot_dir):
+            response = self.client.get('/csv/export/2/', {'since': '2019-02-01T00:00:00'})
+            self.assertEqual(response.status_code, 200)
+            b''.join(response.streaming_content)
+            self.assertEqual(os.listdir(snapshot_dir), [])
+
+    def test_export_shards(self):
+        rows = []
+        for shard in range(2):
+            response = self.client.get('/csv/export/2/', {'shard': shard, 'shards': 2})
+            self.assertEqual(response.status_code, 200)
+            shard_rows = b''.join(response.streaming_content).splitlines(keepends=True)
+            self.assertEqual(len(shard_rows), 2)
+            rows.extend(shard_rows[1:])
+        self.assertEqual(b''.join(sorted(rows)), self.expected_csv.split(b'\r\n', 1)[1])
+
+    @override_settings(WAGTAILCSVIMPORT_EXPORT_WORKERS=2)
+    def test_export_workers_are_spawned(self):
+        with mock.patch('wagtailcsvimport.views.export_pages_parallel',
+                        wraps=export_pages_parallel) as export_mock:
+            response = self.client.get('/csv/export/2/')
+            self.assertEqual(b''.join(response.streaming_content), self.expected_csv)
+        self.assertEqual(export_mock.call_args[1]['workers'], 2)
+        self.assertEqual(export_mock.call_args[1]['mp_context'].get_start_method(), 'spawn')
+
+    def test_export_shards_invalid(self):
+        for params in [{'shard': 0}, {'shards': 2}, {'shard': 2, 'shards': 2},
+                       {'shard': -1, 'shards': 2}, {'shard': 'a', 'shards': 2}]:
+            response = self.client.get('/csv/export/2/', params)
+            self.assertEqual(response.status_code, 400, params)
@@ -4,6 +4,7 @@ from django.test import TestCase
 
 from wagtail.core.models import Page
 
+from tests.models import M2MPage
 from tests.models import SimplePage
 
 
@@ -26,8 +27,10 @@ class ImportViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, '<form action="/admin/csv/import-from-file/" method="GET"')
         self.assertContains(response, '<option value="1">Page</option>')
-        self.assertContains(response, '<option value="6">Simple page</option>')
-        self.assertContains(response, '<option value="7">M2M page</option>')
+        simple_page_ct = ContentType.objects.get_for_model(SimplePage)
+        m2m_page_ct = ContentType.objects.get_for_model(M2MPage)
+        self.assertContains(response, f'<option value="{simple_page_ct.pk}">Simple page</option>')
+        self.assertContains(response, f'<option value="{m2m_page_ct.pk}">M2M page</option>')
         self.assertContains(response, '<form action="/admin/csv/import-from-file/" enctype="multipart/form-data" method="POST"')
         self.assertContains(response, '<input type="file" name="file"')
         # check explanations
@@ -78,3 +81,19 @@ class ImportViewTests(TestCase):
         response = self.client.post('/admin/csv/import-from-file/', data)
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Error decoding file, make sure it&#39;s an UTF-8 encoded CSV file')
+
+    def test_import_post_decode_error(self):
+        csv_data = (
+            b'id,parent,title,int_field\r\n'
+            b',2,New Page,42\r\n'
+            b',2,Wrong \xe9ncoding,27\r\n'
+        )
+        csv_file = SimpleUploadedFile("test_import_post.csv", csv_data, content_type="text/csv")
+        data = {
+            'file': csv_file,
+            'page_type': ContentType.objects.get_for_model(SimplePage).pk,
+        }
+        response = self.client.post('/admin/csv/import-from-file/', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Created page New Page')
+        self.assertContains(response, 'Error decoding row number 2, make sure it&#39;s an UTF-8 encoded CSV file')
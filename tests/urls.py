@@ -4,8 +4,11 @@ from django.urls import path
 from wagtail.admin import urls as wagtailadmin_urls
 from wagtail.core import urls as wagtail_urls
 
+from wagtailcsvimport import urls as wagtailcsvimport_urls
+
 
 urlpatterns = [
     path('admin/', include(wagtailadmin_urls)),
+    path('csv/', include(wagtailcsvimport_urls, namespace='wagtailcsvimport_api')),
     path('', include(wagtail_urls)),
 ]
@@ -8,4 +8,7 @@ app_name = 'wagtailcsvimport'
 urlpatterns = [
     url(r'^import-from-file/$', views.import_from_file, name='import_from_file'),
     url(r'^export-to-file/$', views.export_to_file, name='export_to_file'),
+    url(r'^export-jobs/(?P<job_id>\d+)/$', views.export_job, name='export_job'),
+    url(r'^export-jobs/(?P<job_id>\d+)/download/$', views.export_job_download,
+        name='export_job_download'),
 ]
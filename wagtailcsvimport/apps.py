@@ -6,3 +6,7 @@ class WagtailCsvImportAppConfig(AppConfig):
     name = 'wagtailcsvimport'
     label = 'wagtailcsvimport'
     verbose_name = _("Wagtail CSV Import")
+
+    def ready(self):
+        from .signals import register_signal_handlers
+        register_signal_handlers()
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Max
+
+from .exporting import get_export_buffer_size
+from .exporting import get_export_database
+from .exporting import get_pages_to_export
+from .exporting import get_root_pages
+from .models import ExportVersion
+
+
+logger = logging.getLogger(__name__)
+
+# pk of the single row of ExportVersion
+EXPORT_VERSION_ID = 1
+
+
+def get_export_version(root_page, content_type=None, only_published=True, **params):
+    """Return a token that changes whenever the export would change
+
+    The token is built from the export parameters, from a single
+    aggregate query over the pages to export: the latest publishing
+    and revision dates and the number of pages, and from the counter
+    of changes to pages, see bump_export_version. Any other keyword
+    arguments are export parameters that are included in the token,
+    e.g. fieldnames.
+
+    Changes that don't send any signal, e.g. made with
+    QuerySet.update(), are not detected.
+
+    """
+    page_model, pages = get_pages_to_export(root_page, content_type, only_published)
+    aggregates = pages.order_by().aggregate(
+        last_published_at=Max('last_published_at'),
+        latest_revision_created_at=Max('latest_revision_created_at'),
+        count=Count('pk'),
+    )
+    changes = ExportVersion.objects.using(get_export_database())\
+                                   .filter(pk=EXPORT_VERSION_ID)\
+                                   .values_list('number', flat=True)\
+                                   .first()
+    key = repr((
+        get_export_params_key(root_page, content_type, only_published, **params),
+        aggregates['last_published_at'],
+        aggregates['latest_revision_created_at'],
+        aggregates['count'],
+        changes,
+    ))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def bump_export_version():
+    """Increase the counter of changes to pages
+
+    It's called when pages or sites are saved or deleted, when M2M
+    relations of pages change, see wagtailcsvimport.signals, and by
+    import_pages, which creates pages without saving them, so the
+    version of every export changes.
+
+    """
+    updated = ExportVersion.objects.filter(pk=EXPORT_VERSION_ID)\
+                                   .update(number=F('number') + 1)
+    if not updated:
+        ExportVersion.objects.get_or_create(pk=EXPORT_VERSION_ID, defaults={'number': 1})
+
+
+def get_export_params_key(root_page, content_type=None, only_published=True, **params):
+    """Return a key that identifies the export parameters"""
+    key = repr((
+        [page.pk for page in get_root_pages(root_page)],
+        content_type.pk if content_type else None,
+        only_published,
+        sorted(params.items()),
+    ))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def get_snapshot_dir():
+    """Return the directory for export snapshots, or None if disabled"""
+    return getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_SNAPSHOT_DIR', None)
+
+
+def get_snapshot_path(params_key, version):
+    snapshot_dir = get_snapshot_dir()
+    if snapshot_dir is None:
+        return None
+    return os.path.join(snapshot_dir, f'{params_key}-{version}.csv')
+
+
+def read_snapshot(path):
+    """Return an iterator of bytes blocks of the snapshot in path
+
+    Returns None if there is no snapshot in path.
+
+    """
+    if path is None:
+        return None
+    try:
+        snapshot_file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+    buffer_size = get_export_buffer_size()
+
+    def read_blocks():
+        with snapshot_file:
+            for block in iter(lambda: snapshot_file.read(buffer_size), b''):
+                yield block
+    return read_blocks()
+
+
+def write_snapshot(blocks, path):
+    """Yield the bytes blocks while writing them to a snapshot in path
+
+    The snapshot is written to a temporary file that is only moved to
+    path once all blocks have been consumed, so incomplete exports
+    never become snapshots. Older snapshots for the same export
+    parameters are then removed.
+
+    """
+    snapshot_dir, filename = os.path.split(path)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp_file = tempfile.NamedTemporaryFile(dir=snapshot_dir, prefix='.tmp-', delete=False)
+    try:
+        with tmp_file:
+            for block in blocks:
+                tmp_file.write(block)
+                yield block
+    except BaseException:
+        # includes GeneratorExit when the client stops downloading
+        os.remove(tmp_file.name)
+        raise
+
+    os.replace(tmp_file.name, path)
+    params_key = filename.split('-', 1)[0]
+    for old_filename in os.listdir(snapshot_dir):
+        if old_filename.startswith(f'{params_key}-') and old_filename != filename:
+            try:
+                os.remove(os.path.join(snapshot_dir, old_filename))
+            except FileNotFoundError:
+                # removed concurrently by another request
+                pass
+    logger.info('Saved export snapshot %s', path)
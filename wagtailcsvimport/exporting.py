@@ -1,14 +1,43 @@
+import base64
+import binascii
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import csv
-from datetime import datetime
 from functools import lru_cache
+import hashlib
+import io
 from itertools import chain
+import json
 import logging
+from operator import attrgetter
+import os
+import re
+import zlib
 
+import django
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.db import models
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
 from django.utils.translation import ugettext as _
 try:
     from wagtail.core.models import Page
+    from wagtail.core.models import Site
+    from wagtail.core.utils import WAGTAIL_APPEND_SLASH
 except ImportError:  # fallback for Wagtail <2.0
     from wagtail.wagtailcore.models import Page
+    from wagtail.wagtailcore.models import Site
+    from wagtail.wagtailcore.utils import WAGTAIL_APPEND_SLASH
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+from .models import ExportRow
 
 
 logger = logging.getLogger(__name__)
@@ -20,13 +49,43 @@ BASE_FIELDS_ORDER = ('id', 'content_type', 'parent', 'title', 'slug', 'full_url'
 # Fields in Wagtail's Page model to export by default
 GENERATED_FIELDS = {
     '__all__': {
-        'content_type': lambda page: f'{page.content_type.app_label}.{page.content_type.model}',
+        'content_type': lambda page: get_content_type_label(page.content_type_id),
+        # export_pages builds URLs with a PageURLResolver
         'full_url': lambda page: page.full_url,
-        'parent': lambda page: getattr(page.get_parent(), 'pk'),
+        # export_pages resolves parents in bulk, see get_parent_ids
+        'parent': lambda page: getattr(page.get_parent(), 'pk', None),
     },
-    # TODO: support 'model': function()
+    # fields of specific page models are registered with
+    # register_generated_field
 }
 
+# Generated fields of specific page models, by model and field name
+MODEL_GENERATED_FIELDS = {}
+
+GeneratedField = namedtuple('GeneratedField', ['resolver', 'verbose_name', 'fields'])
+
+# Number of pages fetched from the DB and processed at a time. Data
+# that would otherwise need one query per page, e.g. parent ids, is
+# looked up once per chunk instead.
+EXPORT_CHUNK_SIZE = 2000
+
+# Maximum number of pages in each of the shards that are exported by
+# separate processes in export_pages_parallel
+EXPORT_SHARD_SIZE = 10 * EXPORT_CHUNK_SIZE
+
+# Default minimum size in bytes of the blocks of CSV data sent in
+# streamed responses, can be changed with the
+# WAGTAILCSVIMPORT_EXPORT_BUFFER_SIZE setting
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# Pseudo-field with the continuation cursor of each row, see
+# encode_cursor. It's the last column of exports made with_cursor.
+CURSOR_FIELD = '_cursor'
+
+# Format of exported datetimes. They aren't converted to the current
+# timezone: values are written as stored, in UTC if USE_TZ is True.
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 # Fields that will never be exported
 FIELDS_TO_IGNORE = {
     '__all__': {'content_type', 'depth', 'numchild', 'page_ptr', 'path', 'url_path'},
@@ -34,6 +93,76 @@ FIELDS_TO_IGNORE = {
 }
 
 
+def get_export_database():
+    """Return the alias of the database to read exported pages from
+
+    It's set with the WAGTAILCSVIMPORT_EXPORT_DATABASE setting, e.g.
+    to move the load of big exports to a read replica. None, the
+    default, lets Django's database routers choose.
+
+    """
+    return getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_DATABASE', None)
+
+
+def get_content_type_label(content_type_id, using=None):
+    """Return "app_label.model" for the given content type id
+
+    Content types are cached by Django, so this won't query the DB
+    once a content type has been seen.
+
+    """
+    content_type = ContentType.objects.db_manager(using).get_for_id(content_type_id)
+    return f'{content_type.app_label}.{content_type.model}'
+
+
+def register_generated_field(page_model, fieldname, resolver=None, verbose_name=None,
+                             fields=()):
+    """Register a generated field for page_model and its subclasses
+
+    resolver is called with a list of pages, all of them instances of
+    page_model, and must return a dict of page id to the field's
+    value. Pages missing from the dict get an empty value. It's called
+    once per chunk of pages, so it can fetch related data for all of
+    them with a single query, e.g. tags or image URLs.
+
+    Exports only load the fields being exported, fields is the list of
+    other concrete fields that resolver reads from the pages.
+
+    Can be used as a decorator:
+
+        @register_generated_field(BlogPage, 'tags')
+        def get_tags(pages):
+            ...
+
+    """
+    if resolver is None:
+        def decorator(resolver):
+            register_generated_field(page_model, fieldname, resolver, verbose_name, fields)
+            return resolver
+        return decorator
+
+    MODEL_GENERATED_FIELDS.setdefault(page_model, {})[fieldname] = GeneratedField(
+        resolver, verbose_name or fieldname.replace('_', ' '), tuple(fields)
+    )
+    # exportable fields of page_model and its subclasses have changed
+    get_exportable_fields_for_model.cache_clear()
+    get_generated_fields_for_model.cache_clear()
+    return resolver
+
+
+@lru_cache(64)
+def get_generated_fields_for_model(page_model):
+    """Return a dict of field name to GeneratedField for page_model
+
+    Includes the fields registered for the models it inherits from.
+
+    """
+    generated_fields = {}
+    for model in reversed(page_model.__mro__):
+        generated_fields.update(MODEL_GENERATED_FIELDS.get(model, {}))
+    return generated_fields
+
+
 @lru_cache(64)
 def get_exportable_fields_for_model(page_model):
     fields = []
@@ -43,18 +172,561 @@ def get_exportable_fields_for_model(page_model):
             fields.append(f.name)
     # fields that don't exist on DB
     fields.extend(GENERATED_FIELDS['__all__'].keys())
+    fields.extend(get_generated_fields_for_model(page_model))
+    return sort_fieldnames(fields)
+
+
+def get_exportable_fields_for_models(page_models):
+    """Return the union of exportable fields of all page_models"""
+    fields = set()
+    for page_model in page_models:
+        fields.update(get_exportable_fields_for_model(page_model))
+    return sort_fieldnames(fields)
+
 
-    # sort fields, put common ones first, then the rest alphabetically
+def sort_fieldnames(fields):
+    """Sort fields, put common ones first, then the rest alphabetically"""
     def field_sort(item):
         try:
             return BASE_FIELDS_ORDER.index(item)
         except ValueError:
             return len(BASE_FIELDS_ORDER)
-    fields.sort()
+    fields = sorted(fields)
     fields.sort(key=field_sort)
     return fields
 
 
+def encode_cursor(path):
+    """Return an opaque continuation cursor for the page with path
+
+    Exports can be resumed after the page by passing the decoded
+    cursor as the after argument of export_pages.
+
+    """
+    return base64.urlsafe_b64encode(path.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the path encoded in a continuation cursor
+
+    Raises ValueError if the cursor is not valid.
+
+    """
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        path = base64.urlsafe_b64decode(cursor + padding).decode('ascii')
+    except (binascii.Error, UnicodeError):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+    if not path or len(path) % Page.steplen or \
+            any(c not in Page.alphabet for c in path):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+    return path
+
+
+def iterate_by_path(pages, chunk_size):
+    """Yield lists of pages from the pages queryset, sorted by path
+
+    Uses keyset pagination: every chunk is fetched with its own short
+    query that starts after the last path of the previous chunk, which
+    the index on path serves without sorting the whole queryset. No
+    cursor or transaction is held open between chunks.
+
+    """
+    pages = pages.order_by('path')
+    last_path = None
+    while True:
+        if last_path is None:
+            chunk = list(pages[:chunk_size])
+        else:
+            chunk = list(pages.filter(path__gt=last_path)[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_path = chunk[-1].path
+
+
+def get_parent_ids(pages, known_ids=None, using=None):
+    """Return a dict mapping the path of each parent of pages to its id
+
+    Parent paths are derived from treebeard's materialized path, so
+    all parents are resolved with a single query. known_ids is an
+    optional dict of path to id of pages that have already been
+    loaded, e.g. pages from the previous chunk, which won't be
+    queried again.
+
+    """
+    steplen = Page.steplen
+    parent_ids = {}
+    if known_ids:
+        parent_ids.update(known_ids)
+    missing_paths = {
+        page.path[:-steplen] for page in pages
+        if page.depth > 1 and page.path[:-steplen] not in parent_ids
+    }
+    if missing_paths:
+        parent_ids.update(
+            Page.objects.using(using).filter(path__in=missing_paths)
+                                     .order_by().values_list('path', 'pk')
+        )
+    return parent_ids
+
+
+def get_m2m_ids(field, page_ids, using=None):
+    """Return a dict of page id to ids of its related objects through field
+
+    field must be a ManyToManyField of a page model. All relations of
+    all pages are fetched from the through table in a single query.
+    Like getattr(page, field.name).all(), only the objects in the
+    related model's default manager are included, and related ids are
+    sorted like that manager would sort them.
+
+    """
+    through = field.remote_field.through
+    source_name = field.m2m_field_name()
+    target_name = field.m2m_reverse_field_name()
+    related_model = field.related_model
+    related_objects = related_model._default_manager.using(using).all()
+    ordering = related_objects.query.order_by or related_model._meta.ordering
+    if not all(isinstance(o, str) for o in ordering):
+        # can't follow ordering expressions through the join
+        ordering = ()
+    order_by = [
+        f'-{target_name}__{o[1:]}' if o.startswith('-') else f'{target_name}__{o}'
+        for o in ordering
+    ]
+    order_by.append(target_name)
+
+    related_ids = {}
+    rows = through._default_manager.using(using)\
+                                   .filter(**{f'{source_name}__in': page_ids,
+                                              f'{target_name}__in': related_objects.values('pk')})\
+                                   .order_by(*order_by)\
+                                   .values_list(source_name, target_name)
+    for page_id, related_id in rows:
+        related_ids.setdefault(page_id, []).append(str(related_id))
+    return related_ids
+
+
+class PageURLResolver:
+    """Build the full URL of pages without any per-page lookups
+
+    Page.full_url fetches the site root paths and reverses the
+    wagtail_serve URL for every page. This does both once, when the
+    resolver is created, and then builds every URL from the page's
+    url_path. URLs are the same that Page.full_url returns.
+
+    Page models that override get_url_parts may have custom URLs, for
+    those Page.full_url is used. So it is when Wagtail's i18n is
+    enabled, since the URL then depends on the page's language.
+
+    """
+    # url_path segments that reverse() wouldn't need to quote
+    plain_path_re = re.compile(r'[A-Za-z0-9_\-/]*')
+
+    def __init__(self):
+        # (site_id, root_path, root_url), Wagtail 2.11+ adds language_code
+        self.site_root_paths = [
+            (site_root_path[1], site_root_path[2])
+            for site_root_path in Site.get_site_root_paths()
+        ]
+        self.serve_prefix = reverse('wagtail_serve', args=('',))
+        self.use_full_url = getattr(settings, 'WAGTAIL_I18N_ENABLED', False)
+
+    def get_full_url(self, page):
+        if self.use_full_url or type(page).get_url_parts is not Page.get_url_parts:
+            return page.full_url
+
+        url_path = page.url_path
+        for root_path, root_url in self.site_root_paths:
+            if url_path.startswith(root_path):
+                break
+        else:
+            # page is not routable
+            return None
+
+        relative_path = url_path[len(root_path):]
+        if self.plain_path_re.fullmatch(relative_path):
+            page_path = self.serve_prefix + relative_path
+        else:
+            # needs quoting, let reverse() take care of it
+            page_path = reverse('wagtail_serve', args=(relative_path,))
+
+        if not WAGTAIL_APPEND_SLASH and page_path != '/':
+            page_path = page_path.rstrip('/')
+
+        return root_url + page_path
+
+
+def format_datetime(value):
+    """Format datetimes without timezone information
+
+    Timezone information causes errors when importing.
+
+    """
+    if value is None:
+        return None
+    return value.strftime(DATETIME_FORMAT)
+
+
+class ExportPlan:
+    """Compiled list of column extractors for exporting a page model
+
+    Field metadata is looked up once, when the plan is created, and
+    each column gets a callable that takes a page and returns the
+    value to write to the CSV. Writing a row is then just calling
+    every extractor in order.
+
+    Generated fields that need data from other pages or models are
+    resolved for a whole chunk of pages at once, see prepare_chunk.
+    Those queries are made on the database using.
+
+    """
+
+    def __init__(self, page_model, fieldnames, using=None):
+        self.page_model = page_model
+        self.fieldnames = tuple(fieldnames)
+        self.using = using
+        self.parent_ids = {}
+        self.previous_ids = {}
+        self.m2m_fields = []
+        self.m2m_ids = {}
+        self.generated_fields = get_generated_fields_for_model(page_model)
+        self.batch_fields = []
+        self.batch_values = {}
+        self.url_resolver = PageURLResolver() if 'full_url' in self.fieldnames else None
+        self.extractors = tuple(self.get_extractor(f) for f in self.fieldnames)
+
+    def get_extractor(self, fieldname):
+        """Return a callable that extracts fieldname's value from a page"""
+        if fieldname == 'parent':
+            steplen = Page.steplen
+            return lambda page: self.parent_ids.get(page.path[:-steplen])
+        elif fieldname == 'full_url':
+            return self.url_resolver.get_full_url
+        elif fieldname == CURSOR_FIELD:
+            return lambda page: encode_cursor(page.path)
+        elif fieldname == 'content_type':
+            using = self.using
+            return lambda page: get_content_type_label(page.content_type_id, using)
+        elif fieldname in self.generated_fields:
+            # resolved for the whole chunk of pages
+            self.batch_fields.append(fieldname)
+            return lambda page: self.batch_values[fieldname].get(page.pk)
+        elif fieldname in GENERATED_FIELDS['__all__']:
+            return GENERATED_FIELDS['__all__'][fieldname]
+
+        field = self.page_model._meta.get_field(fieldname)
+        if field.many_to_many:
+            # M2M, write comma-separated list of all related objects'
+            # ids. These are fetched for the whole chunk of pages.
+            self.m2m_fields.append(field)
+            return lambda page: ','.join(self.m2m_ids[fieldname].get(page.pk, ()))
+        elif type(field).value_from_object is not models.Field.value_from_object:
+            # field with custom logic to get its value
+            return field.value_from_object
+        elif isinstance(field, models.DateTimeField):
+            get_value = attrgetter(field.attname)
+            return lambda page: format_datetime(get_value(page))
+        else:
+            # regular field or foreign key, in which case the related
+            # object's id is written
+            return attrgetter(field.attname)
+
+    def get_only_fields(self):
+        """Return names of the fields that need to be loaded from the DB
+
+        These are the concrete fields being exported, plus the ones
+        generated fields depend on. Returns None if it's not possible
+        to know which fields are needed, e.g. if there are custom
+        generated fields or the page model has custom URLs, in which
+        case all fields should be loaded.
+
+        """
+        only_fields = {'id', 'path', 'depth', 'url_path', 'content_type'}
+        for fieldname in self.fieldnames:
+            if fieldname == CURSOR_FIELD:
+                continue
+            elif fieldname in self.generated_fields:
+                only_fields.update(self.generated_fields[fieldname].fields)
+            elif fieldname in GENERATED_FIELDS['__all__']:
+                if fieldname not in ('content_type', 'full_url', 'parent'):
+                    return None
+                elif fieldname == 'full_url' and \
+                        self.page_model.get_url_parts is not Page.get_url_parts:
+                    return None
+            else:
+                field = self.page_model._meta.get_field(fieldname)
+                if not field.many_to_many:
+                    only_fields.add(fieldname)
+        return sorted(only_fields)
+
+    def prepare_chunk(self, pages, parent_ids=None):
+        """Resolve in bulk the data that rows of pages need
+
+        parent_ids can be given if parents have already been resolved.
+
+        """
+        if parent_ids is not None:
+            self.parent_ids = parent_ids
+        elif 'parent' in self.fieldnames:
+            self.resolve_parents(pages)
+        if self.m2m_fields:
+            page_ids = [page.pk for page in pages]
+            self.m2m_ids = {
+                field.name: get_m2m_ids(field, page_ids, using=self.using)
+                for field in self.m2m_fields
+            }
+        if self.batch_fields:
+            self.batch_values = {
+                fieldname: self.generated_fields[fieldname].resolver(pages)
+                for fieldname in self.batch_fields
+            }
+
+    def resolve_parents(self, pages):
+        # Pages are sorted by path, so parents come before their
+        # children and many will be in this chunk or in the previous
+        # one, those don't need to be queried.
+        chunk_ids = {page.path: page.pk for page in pages}
+        self.parent_ids = get_parent_ids(pages, known_ids={**self.previous_ids, **chunk_ids},
+                                         using=self.using)
+        self.previous_ids = chunk_ids
+
+    def get_rows(self, pages, parent_ids=None):
+        """Return an iterator of CSV rows, as lists, for pages"""
+        self.prepare_chunk(pages, parent_ids=parent_ids)
+        extractors = self.extractors
+        for page in pages:
+            yield [extract(page) for extract in extractors]
+
+
+class SpecificExportPlan:
+    """Export plan for pages of different types, with their specific fields
+
+    Exported columns are the union of the fields of all the page
+    models, a page's value for fields its model doesn't have is left
+    empty.
+
+    Pages are walked once as base Page instances, only loading the
+    fields necessary to classify them. Each chunk is then grouped by
+    content type and the specific pages of every group are fetched
+    with one query, and exported with an ExportPlan for their model.
+
+    """
+
+    def __init__(self, content_type_ids, fieldnames, using=None):
+        self.fieldnames = tuple(fieldnames)
+        self.using = using
+        self.parent_ids = {}
+        self.previous_ids = {}
+        self.plans = {}
+        for content_type_id in content_type_ids:
+            self.get_plan(content_type_id)
+
+    resolve_parents = ExportPlan.resolve_parents
+
+    def get_plan(self, content_type_id):
+        """Return the ExportPlan of a content type and its column indexes
+
+        Plans are created on the fly for content types that weren't
+        known when the export started, e.g. of pages added or changed
+        since then. They only export the columns their model has.
+
+        """
+        try:
+            return self.plans[content_type_id]
+        except KeyError:
+            pass
+        content_type = ContentType.objects.db_manager(self.using).get_for_id(content_type_id)
+        page_model = content_type.model_class()
+        if page_model is None:
+            # stale content type, export it as a basic page
+            page_model = Page
+        model_fields = set(get_exportable_fields_for_model(page_model))
+        model_fields.add(CURSOR_FIELD)
+        indexes = [i for i, f in enumerate(self.fieldnames) if f in model_fields]
+        plan = ExportPlan(page_model, [self.fieldnames[i] for i in indexes], self.using)
+        self.plans[content_type_id] = (plan, indexes)
+        return plan, indexes
+
+    def get_only_fields(self):
+        return ['id', 'path', 'depth', 'content_type']
+
+    def get_rows(self, pages):
+        """Return an iterator of CSV rows, as lists, for pages"""
+        # parents can be resolved from the base pages, for all types
+        # at once
+        parent_ids = None
+        if 'parent' in self.fieldnames:
+            self.resolve_parents(pages)
+            parent_ids = self.parent_ids
+
+        page_ids_by_type = {}
+        for page in pages:
+            page_ids_by_type.setdefault(page.content_type_id, []).append(page.pk)
+
+        rows = {}
+        num_fields = len(self.fieldnames)
+        for content_type_id, page_ids in page_ids_by_type.items():
+            plan, indexes = self.get_plan(content_type_id)
+            specific_pages = plan.page_model._default_manager.using(self.using)
+            only_fields = plan.get_only_fields()
+            if only_fields:
+                specific_pages = specific_pages.only(*only_fields)
+            specific_pages = specific_pages.in_bulk(page_ids)
+            # keep tree order, skip pages deleted since the chunk was read
+            specific_pages = [specific_pages[i] for i in page_ids if i in specific_pages]
+            rows_iter = plan.get_rows(specific_pages, parent_ids=parent_ids)
+            for page, values in zip(specific_pages, rows_iter):
+                row = [None] * num_fields
+                for i, value in zip(indexes, values):
+                    row[i] = value
+                rows[page.pk] = row
+
+        for page in pages:
+            if page.pk in rows:
+                yield rows[page.pk]
+
+
+def get_export_rows_enabled():
+    """Return whether exports read pages from the table of export rows
+
+    It's enabled with the WAGTAILCSVIMPORT_EXPORT_ROWS_TABLE setting.
+
+    """
+    return getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_ROWS_TABLE', False)
+
+
+def get_export_row_schema(page_model):
+    """Return a key of the exportable fields of page_model
+
+    It's stored with the export rows of its pages. If fields are added
+    or removed, e.g. by a migration or by registering a generated
+    field, the key changes and rows with the old one are serialized
+    again.
+
+    """
+    fieldnames = get_exportable_fields_for_model(page_model)
+    return hashlib.sha1(repr(fieldnames).encode('utf-8')).hexdigest()
+
+
+def serialize_export_rows(page_ids):
+    """Return a dict of page id to the (url_path, schema, data) of its export row
+
+    data is a JSON object with the values of all the exportable fields
+    of the page's specific model, as they are written to CSV, and
+    schema the key of those fields, see get_export_row_schema. Pages
+    are fetched with one query per page type.
+
+    """
+    pages = Page.objects.filter(pk__in=page_ids).order_by().values_list('pk', 'content_type')
+    page_ids_by_type = {}
+    for page_id, content_type_id in pages:
+        page_ids_by_type.setdefault(content_type_id, []).append(page_id)
+
+    serialized = {}
+    for content_type_id, type_page_ids in page_ids_by_type.items():
+        page_model = ContentType.objects.get_for_id(content_type_id).model_class() or Page
+        fieldnames = get_exportable_fields_for_model(page_model)
+        schema = get_export_row_schema(page_model)
+        plan = ExportPlan(page_model, fieldnames)
+        specific_pages = list(
+            page_model._default_manager.filter(pk__in=type_page_ids).order_by('path')
+        )
+        for page, values in zip(specific_pages, plan.get_rows(specific_pages)):
+            data = {
+                fieldname: None if value is None else str(value)
+                for fieldname, value in zip(fieldnames, values)
+            }
+            serialized[page.pk] = (page.url_path, schema, json.dumps(data))
+    return serialized
+
+
+def update_export_rows(page_ids):
+    """Serialize the pages with page_ids and save their export rows
+
+    Returns a dict of page id to its serialized data. Pages that don't
+    exist are skipped.
+
+    Concurrent exports may serialize the same missing pages, rows that
+    another one inserted in the meantime are kept instead of raising
+    IntegrityError.
+
+    """
+    serialized = serialize_export_rows(page_ids)
+    with transaction.atomic():
+        ExportRow.objects.filter(page_id__in=list(serialized)).delete()
+        ExportRow.objects.bulk_create([
+            ExportRow(page_id=page_id, url_path=url_path, schema=schema, data=data)
+            for page_id, (url_path, schema, data) in serialized.items()
+        ], ignore_conflicts=True)
+    return {page_id: data for page_id, (url_path, schema, data) in serialized.items()}
+
+
+def iterate_export_rows(pages, fieldnames):
+    """Yield CSV rows, as lists, of pages from the table of export rows
+
+    Rows are read in tree order, a chunk at a time, with one query
+    that joins the pages with their export rows, so pages are neither
+    instantiated nor serialized. Pages without an export row, e.g.
+    created before the table was enabled, or whose row was serialized
+    with other fields than their model has now, are serialized then
+    and their export rows saved.
+
+    Rows are kept up to date by the handlers in signals.py. When an
+    object that pages relate to is deleted, SET_NULL foreign keys are
+    set to null and M2M relations removed without sending any signal
+    for the pages, so their rows stay stale.
+
+    """
+    rows = pages.order_by('path').values_list('pk', 'path', 'content_type',
+                                              'export_row__schema', 'export_row__data')
+    schemas = {}
+    last_path = None
+    while True:
+        if last_path is None:
+            chunk = list(rows[:EXPORT_CHUNK_SIZE])
+        else:
+            chunk = list(rows.filter(path__gt=last_path)[:EXPORT_CHUNK_SIZE])
+
+        chunk_rows = []
+        for page_id, path, content_type_id, schema, data in chunk:
+            if content_type_id not in schemas:
+                content_type = ContentType.objects.db_manager(pages.db).get_for_id(content_type_id)
+                page_model = content_type.model_class() or Page
+                schemas[content_type_id] = get_export_row_schema(page_model)
+            if schema != schemas[content_type_id]:
+                data = None
+            chunk_rows.append((page_id, path, data))
+
+        missing_ids = [page_id for page_id, path, data in chunk_rows if data is None]
+        new_data = update_export_rows(missing_ids) if missing_ids else {}
+        for page_id, path, data in chunk_rows:
+            if data is None:
+                data = new_data.get(page_id)
+                if data is None:
+                    # deleted since the chunk was read
+                    continue
+            values = json.loads(data)
+            yield [
+                encode_cursor(path) if fieldname == CURSOR_FIELD else values.get(fieldname)
+                for fieldname in fieldnames
+            ]
+
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+        last_path = chunk[-1][1]
+
+
+def iterate_rows(pages, plan):
+    """Yield CSV rows, as lists, of pages in tree order"""
+    if get_export_rows_enabled():
+        yield from iterate_export_rows(pages, plan.fieldnames)
+        return
+    for chunk in iterate_by_path(pages, EXPORT_CHUNK_SIZE):
+        yield from plan.get_rows(chunk)
+
+
 class Echo:
     """Implement just the write method of the file-like interface."""
 
@@ -63,10 +735,226 @@ class Echo:
         return value
 
 
+def get_export_buffer_size():
+    return getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_BUFFER_SIZE', EXPORT_BUFFER_SIZE)
+
+
+def buffer_rows(rows, buffer_size=None):
+    """Group CSV rows in blocks of at least buffer_size bytes
+
+    Rows are encoded to UTF-8 and yielded as bytes. Sending a few big
+    blocks instead of one tiny string per row reduces the per-write
+    overhead of streamed responses, while memory usage stays bounded
+    by buffer_size. The last block may be smaller.
+
+    If buffer_size is None the WAGTAILCSVIMPORT_EXPORT_BUFFER_SIZE
+    setting is used.
+
+    """
+    if buffer_size is None:
+        buffer_size = get_export_buffer_size()
+    buffer = []
+    size = 0
+    for row in rows:
+        data = row.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def get_compression_encodings():
+    """Return supported compression encodings, preferred ones first"""
+    if zstandard is not None:
+        return ('zstd', 'gzip')
+    return ('gzip',)
+
+
+def compress_blocks(blocks, encoding):
+    """Compress an iterator of bytes blocks on the fly
+
+    encoding is either "gzip" or "zstd", the latter requires the
+    zstandard package. Only the compressor's internal buffer is kept
+    in memory, so compressing a stream doesn't change its memory
+    usage.
+
+    """
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    elif encoding == 'zstd' and zstandard is not None:
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError(_('Unsupported compression encoding: %(encoding)s') % {
+            'encoding': encoding
+        })
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def get_root_pages(root_page):
+    """Return the roots of an export as a list of pages sorted by path
+
+    root_page can be a page or a list of pages. Pages that are
+    descendants of other roots are removed, as they are already
+    exported with them.
+
+    """
+    if isinstance(root_page, Page):
+        return [root_page]
+    root_pages = []
+    # descendants come right after their ancestors when sorted by path
+    for page in sorted(root_page, key=attrgetter('path')):
+        if not root_pages or not page.path.startswith(root_pages[-1].path):
+            root_pages.append(page)
+    return root_pages
+
+
+def get_pages_to_export(root_page, content_type=None, only_published=True, since=None):
+    """Return the page model and queryset of the pages to export
+
+    root_page can be a page or a list of pages, see get_root_pages.
+    The descendants of all of them are selected by a single query.
+
+    If since is given only pages published or revised after that
+    datetime are included.
+
+    Pages are read from the database returned by get_export_database.
+
+    """
+    if content_type:
+        page_model = content_type.model_class()
+    else:
+        page_model = Page
+
+    in_subtrees = Q(pk__in=[])
+    for page in get_root_pages(root_page):
+        in_subtrees |= Q(path__startswith=page.path)
+    pages = page_model.objects.using(get_export_database()).filter(in_subtrees)
+    if content_type:
+        pages = pages.filter(content_type=content_type)
+    if only_published:
+        pages = pages.live()
+    if since is not None:
+        published_or_revised = Q(first_published_at__gt=since) | Q(last_published_at__gt=since)
+        published_or_revised |= Q(latest_revision_created_at__gt=since)
+        pages = pages.filter(published_or_revised)
+    return page_model, pages
+
+
+def filter_shard(pages, shard_index, shard_count):
+    """Return the pages of one of shard_count slices of contiguous paths
+
+    Slices have the same number of pages, give or take one. Finding
+    their boundaries takes a count and at most two queries that walk
+    the index on path, which are cheap compared to reading the pages,
+    and then only the pages of the slice are read, by their range of
+    paths. Boundaries depend on the pages there are, so if pages are
+    added or removed while the slices are being exported some may be
+    missing or repeated.
+
+    """
+    paths = pages.order_by('path').values_list('path', flat=True)
+    count = paths.count()
+    start = count * shard_index // shard_count
+    end = count * (shard_index + 1) // shard_count
+    if start == end:
+        return pages.none()
+    # boundaries are missing if pages are removed after counting them
+    if start > 0:
+        first_path = list(paths[start:start + 1])
+        if not first_path:
+            return pages.none()
+        pages = pages.filter(path__gte=first_path[0])
+    if end < count:
+        end_path = list(paths[end:end + 1])
+        if end_path:
+            pages = pages.filter(path__lt=end_path[0])
+    return pages
+
+
+def prepare_export(root_page, content_type=None, fieldnames=None,
+                   only_published=True, specific=False, since=None,
+                   after=None, with_cursor=False, shard=None, content_type_ids=None):
+    """Return the queryset of pages to export and the plan to export them
+
+    Arguments are the same as for export_pages. For specific exports
+    content_type_ids can be given if the types of the pages are
+    already known, to avoid querying them. They are the types of all
+    the pages to export, before taking only a shard or the pages after
+    a cursor.
+
+    Raises ValueError if there are unrecognized fields.
+
+    """
+    using = get_export_database()
+    page_model, pages = get_pages_to_export(root_page, content_type, only_published, since)
+
+    if specific and not content_type:
+        if content_type_ids is None:
+            content_type_ids = list(
+                pages.order_by().values_list('content_type', flat=True).distinct()
+            )
+        page_models = [
+            ContentType.objects.db_manager(using).get_for_id(ct_id).model_class() or Page
+            for ct_id in content_type_ids
+        ]
+        all_exportable_fields = get_exportable_fields_for_models(page_models)
+    else:
+        content_type_ids = None
+        all_exportable_fields = get_exportable_fields_for_model(page_model)
+
+    # columns come from all the pages, so that resumed downloads and
+    # every shard of an export have the same header
+    if shard is not None:
+        # before filtering by after, so resumed shards keep their range
+        pages = filter_shard(pages, *shard)
+    if after is not None:
+        pages = pages.filter(path__gt=after)
+
+    if fieldnames:
+        # validate that there are no extraneous fields
+        unrecognized_fields = set(fieldnames) - set(all_exportable_fields) - {CURSOR_FIELD}
+        if unrecognized_fields:
+            raise ValueError(_("Don't recognize these fields: %(field_list)s") % {
+                'field_list': sorted(unrecognized_fields)
+            })
+    else:
+        # default to all exportable fields for the given model
+        fieldnames = all_exportable_fields
+    if with_cursor and CURSOR_FIELD not in fieldnames:
+        fieldnames = list(fieldnames) + [CURSOR_FIELD]
+
+    if content_type_ids is not None:
+        plan = SpecificExportPlan(content_type_ids, fieldnames, using)
+    else:
+        plan = ExportPlan(page_model, fieldnames, using)
+    only_fields = plan.get_only_fields()
+    if only_fields:
+        # don't load columns that won't be exported, e.g. big text fields
+        pages = pages.only(*only_fields)
+
+    return pages, plan
+
+
 def export_pages(root_page, content_type=None, fieldnames=None,
-                 only_published=True):
+                 only_published=True, specific=False, since=None,
+                 after=None, with_cursor=False, shard=None):
     """Return iterator of CSV rows of all descendants of root_page (inclusive)
 
+    root_page can also be a list of pages, then the descendants of all
+    of them are exported. Pages in overlapping subtrees are only
+    exported once.
+
+    Pages are exported in tree order, i.e. sorted by path, so parents
+    always come before their children.
+
     If content_type is provided it should be an instance of
     django.contrib.contenttypes.models.ContentType of a Page subclass.
 
@@ -80,22 +968,43 @@ def export_pages(root_page, content_type=None, fieldnames=None,
     False the root_page and all its descendants, published or not, are
     included.
 
+    If specific is True and no content_type is given then pages of all
+    types are exported with their specific fields, in a single pass
+    over the tree. Exportable fields are then the union of the fields
+    of all page types found under root_page.
+
+    If since is given, it should be a datetime and only pages that
+    have been published or revised after it will be exported. Changes
+    that don't publish nor create a revision, e.g. updates made by
+    importing a CSV file, are not detected.
+
+    If with_cursor is True a last "_cursor" column is added with an
+    opaque continuation cursor for every row. If a download is
+    interrupted, the export can be resumed after the last received
+    row passing its decoded cursor, see decode_cursor, as after. Only
+    pages whose path comes after it are exported then.
+
+    If shard is given it should be a (shard_index, shard_count) tuple,
+    and only the shard_index-th of shard_count slices of contiguous
+    paths is exported, see filter_shard. The shards of an export are
+    disjoint and together they include all pages, so they can be
+    downloaded concurrently. Parents may be in a previous shard than
+    their children.
+
+    If the WAGTAILCSVIMPORT_EXPORT_ROWS_TABLE setting is True rows are
+    read already serialized from the table of export rows, see
+    iterate_export_rows.
+
     """
     logger.info('Exporting pages to CSV with args root_page=%s '
-                'content_type=%s fieldnames=%s only_published=%s',
-                root_page, content_type, fieldnames, only_published)
+                'content_type=%s fieldnames=%s only_published=%s specific=%s '
+                'since=%s after=%s with_cursor=%s shard=%s', root_page,
+                content_type, fieldnames, only_published, specific, since,
+                after, with_cursor, shard)
 
-    if content_type:
-        page_model = content_type.model_class()
-    else:
-        page_model = Page
-
-    pages = page_model.objects.descendant_of(root_page, inclusive=True)\
-                              .order_by('depth', 'path')
-    if content_type:
-        pages = pages.filter(content_type=content_type)
-    if only_published:
-        pages = pages.live()
+    pages, plan = prepare_export(root_page, content_type, fieldnames,
+                                 only_published, specific, since,
+                                 after, with_cursor, shard)
 
     # Don't write to a file or even a StringIO, as that would consume
     # memory unnecessarily. We will be yielding CSV rows one by one as
@@ -103,44 +1012,134 @@ def export_pages(root_page, content_type=None, fieldnames=None,
     # which is the purpose of the Echo class.
     pseudo_buffer = Echo()
 
-    if fieldnames:
-        # validate that there are no extraneous fields
-        all_exportable_fields = get_exportable_fields_for_model(page_model)
-        unrecognized_fields = set(fieldnames) - set(all_exportable_fields)
-        if unrecognized_fields:
-            raise ValueError(_("Don't recognize these fields: %(field_list)s") % {
-                'field_list': sorted(unrecognized_fields)
-            })
+    csv_writer = csv.writer(pseudo_buffer)
+    yield csv_writer.writerow(plan.fieldnames)
+
+    for row in iterate_rows(pages, plan):
+        yield csv_writer.writerow(row)
+
+
+def get_path_ranges(pages, shard_size):
+    """Split pages in ranges of paths of at most shard_size pages each
+
+    Returns a list of (first_path, end_path) tuples, end_path is not
+    included in the range. The first range starts at None and the last
+    one ends at None, meaning that they are open. Boundaries are found
+    walking the index on path, with one query per range.
+
+    """
+    paths = pages.order_by('path').values_list('path', flat=True)
+    boundaries = []
+    while True:
+        if boundaries:
+            next_paths = paths.filter(path__gt=boundaries[-1])
+            boundary = list(next_paths[shard_size - 1:shard_size])
+        else:
+            boundary = list(paths[shard_size:shard_size + 1])
+        if not boundary:
+            break
+        boundaries.append(boundary[0])
+    return list(zip([None] + boundaries, boundaries + [None]))
+
+
+def export_shard(root_page_ids, content_type_id, export_kwargs, path_range):
+    """Return the CSV rows of the pages in path_range as a single string
+
+    This is run by the worker processes of export_pages_parallel, so
+    it receives ids and other picklable arguments instead of model
+    instances. export_kwargs are the rest of arguments of
+    prepare_export, fieldnames must be the already validated
+    fieldnames of the whole export.
+
+    """
+    using = get_export_database()
+    root_page = list(Page.objects.using(using).filter(pk__in=root_page_ids))
+    if content_type_id:
+        content_type = ContentType.objects.db_manager(using).get_for_id(content_type_id)
     else:
-        # default to all exportable fields for the given model
-        fieldnames = get_exportable_fields_for_model(page_model)
+        content_type = None
+    pages, plan = prepare_export(root_page, content_type, **export_kwargs)
+    first_path, end_path = path_range
+    if first_path is not None:
+        pages = pages.filter(path__gte=first_path)
+    if end_path is not None:
+        pages = pages.filter(path__lt=end_path)
 
-    csv_writer = csv.DictWriter(pseudo_buffer, fieldnames=fieldnames)
-    header = dict(zip(fieldnames, fieldnames))
-    yield csv_writer.writerow(header)
+    output = io.StringIO()
+    csv_writer = csv.writer(output)
+    csv_writer.writerows(iterate_rows(pages, plan))
+    return output.getvalue()
 
-    generated_fields = GENERATED_FIELDS['__all__']
-    for (i, page) in enumerate(pages.iterator()):
-        page_data = {}
-        for fieldname in fieldnames:
-            if fieldname in generated_fields:
-                page_data[fieldname] = generated_fields[fieldname](page)
-            else:
-                field = page._meta.get_field(fieldname)
-                if field.many_to_many:
-                    # M2M, write comma-separated list of all related objects' ids
-                    related_objs = field.value_from_object(page)
-                    obj_ids = [str(obj.pk) for obj in related_objs]
-                    page_data[fieldname] = ','.join(obj_ids)
-                elif field.is_relation:
-                    # foreign key, write related object's id
-                    page_data[fieldname] = field.value_from_object(page)
-                else:
-                    # regular non-relation field
-                    value = field.value_from_object(page)
-                    if isinstance(value, datetime):
-                        # don't output timezone information, it causes
-                        # errors when importing
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    page_data[fieldname] = value
-        yield csv_writer.writerow(page_data)
+
+def export_pages_parallel(root_page, content_type=None, fieldnames=None,
+                          only_published=True, specific=False, since=None,
+                          after=None, with_cursor=False, shard=None, workers=None,
+                          mp_context=None):
+    """Return iterator of CSV rows of root_page and its descendants
+
+    Same as export_pages, but the pages are split in shards of
+    contiguous paths that are serialized by a pool of workers
+    processes. Shards are yielded in tree order as soon as they're
+    ready, each one as a string with all its rows. To keep memory
+    usage bounded at most twice as many shards as workers are being
+    processed at any time.
+
+    workers defaults to the number of CPUs. If it's 1 or there is only
+    one shard, they are processed in this process. mp_context is the
+    multiprocessing context used to start them, by default the
+    platform's. Workers set up Django when they start, so it's safe to
+    use the "spawn" start method, which is what processes with threads
+    should use.
+
+    """
+    logger.info('Exporting pages to CSV in parallel with args root_page=%s '
+                'content_type=%s fieldnames=%s only_published=%s specific=%s '
+                'since=%s after=%s with_cursor=%s shard=%s workers=%s',
+                root_page, content_type, fieldnames, only_published, specific,
+                since, after, with_cursor, shard, workers)
+
+    pages, plan = prepare_export(root_page, content_type, fieldnames,
+                                 only_published, specific, since,
+                                 after, with_cursor, shard)
+    csv_writer = csv.writer(Echo())
+    yield csv_writer.writerow(plan.fieldnames)
+
+    shard_args = (
+        [page.pk for page in get_root_pages(root_page)],
+        content_type.pk if content_type else None,
+        {
+            'fieldnames': plan.fieldnames,
+            'only_published': only_published,
+            'specific': specific,
+            'since': since,
+            'after': after,
+            'shard': shard,
+            'content_type_ids': (list(plan.plans)
+                                 if isinstance(plan, SpecificExportPlan) else None),
+        },
+    )
+    path_ranges = get_path_ranges(pages, EXPORT_SHARD_SIZE)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(path_ranges) == 1:
+        for path_range in path_ranges:
+            yield export_shard(*shard_args, path_range)
+        return
+
+    # Worker processes must open their own DB connections instead of
+    # sharing the ones of this process
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                             initializer=django.setup) as executor:
+        pending = deque()
+        try:
+            for path_range in path_ranges:
+                pending.append(executor.submit(export_shard, *shard_args, path_range))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # export may have been interrupted, don't process the rest
+            for future in pending:
+                future.cancel()
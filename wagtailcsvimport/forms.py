@@ -16,6 +16,7 @@ except ImportError:  # fallback for Wagtail <2.0
 
 
 from .exporting import get_exportable_fields_for_model
+from .exporting import get_generated_fields_for_model
 
 
 class PageTypeForm(forms.Form):
@@ -72,8 +73,31 @@ class PageTypeForm(forms.Form):
         return Media(js=['wagtailcsvimport/js/page_type_form_helpers.js'])
 
 
+class PageIdsInput(forms.TextInput):
+
+    def format_value(self, value):
+        if isinstance(value, (list, tuple)):
+            return ','.join(str(page_id) for page_id in value)
+        return super().format_value(value)
+
+
+class PageIdsField(forms.ModelMultipleChoiceField):
+    """Field to choose pages by a comma-separated list of their ids"""
+    widget = PageIdsInput
+
+    def clean(self, value):
+        if isinstance(value, str):
+            value = [page_id.strip() for page_id in value.split(',') if page_id.strip()]
+        return super().clean(value)
+
+
 class ImportForm(forms.Form):
     file = forms.FileField(label=_("File to import"))
+    bulk_create = forms.BooleanField(
+        label=_('Create new pages in bulk?'),
+        required=False,
+        help_text=_("Much faster for big imports, but pages are created without sending signals, so the search index won't be updated.")
+    )
 
 
 class ExportForm(forms.Form):
@@ -85,12 +109,28 @@ class ExportForm(forms.Form):
         label=_('Include only published pages?'),
         required=False
     )
+    compress = forms.BooleanField(
+        label=_('Compress file?'),
+        required=False,
+        help_text=_("Download a gzip-compressed .csv.gz file.")
+    )
+    background = forms.BooleanField(
+        label=_('Export in the background?'),
+        required=False,
+        help_text=_("Recommended for big exports. The file will be available for download once it's ready.")
+    )
     root_page = forms.ModelChoiceField(
         label=_('Root page to export'),
         queryset=Page.objects.all().specific(),
         widget=AdminPageChooser(can_choose_root=True),
         help_text=_("Will export this page and all its descendants of the chosen page type.")
     )
+    other_root_pages = PageIdsField(
+        label=_('Other root pages to export'),
+        queryset=Page.objects.all(),
+        required=False,
+        help_text=_("Comma-separated ids of other pages to export with all their descendants.")
+    )
 
     def __init__(self, *args, **kwargs):
         page_model = kwargs.pop('page_model', Page)
@@ -98,6 +138,16 @@ class ExportForm(forms.Form):
         self.fields['fields'].choices = self.get_export_fields_choices(page_model)
         self.fields['fields'].initial = [c[0] for c in self.get_export_fields_choices(Page)]
 
+    def get_root_pages(self):
+        """Return the list of pages to export with their descendants
+
+        Raises ValueError if the form isn't bound or isn't valid.
+
+        """
+        if not self.is_valid():
+            raise ValueError('get_root_pages() needs a bound and valid form')
+        return [self.cleaned_data['root_page'], *self.cleaned_data['other_root_pages']]
+
     @staticmethod
     @lru_cache(64)
     def get_export_fields_choices(page_model):
@@ -105,8 +155,11 @@ class ExportForm(forms.Form):
         if page_model is None:
             page_model = Page
         exportable_fields = get_exportable_fields_for_model(page_model)
+        generated_fields = get_generated_fields_for_model(page_model)
         for field_name in exportable_fields:
-            if field_name == 'content_type':
+            if field_name in generated_fields:
+                choices.append((field_name, generated_fields[field_name].verbose_name))
+            elif field_name == 'content_type':
                 choices.append(('content_type', 'Page type'))
             elif field_name == 'full_url':
                 choices.append(('full_url', 'URL'))
@@ -1,25 +1,50 @@
+from collections import Counter
+from collections import defaultdict
 import csv
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
 import logging
+import re
 
 from django import forms
 from django.core.exceptions import FieldError
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxLengthValidator
+from django.core.validators import MaxValueValidator
+from django.core.validators import MinLengthValidator
+from django.core.validators import MinValueValidator
+from django.core.validators import ProhibitNullCharactersValidator
+from django.db import connections
+from django.db import router
 from django.db import transaction
+from django.db import models
+from django.db.models import F
+from django.forms.utils import from_current_timezone
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
 from wagtail.admin.rich_text.editors.draftail import DraftailRichTextArea
+from wagtail.core.fields import RichTextField
 from wagtail.core.models import Page
+from treebeard.exceptions import PathOverflow
 
+from .caching import bump_export_version
+from .exporting import CURSOR_FIELD
+from .exporting import DATETIME_FORMAT
 from .exporting import get_exportable_fields_for_model
+from .exporting import get_generated_fields_for_model
 
 
 logger = logging.getLogger(__name__)
 
 
-IGNORED_FIELDS = {'content_type', 'depth', 'first_published_at', 'full_url',
-                  'live', 'numchild', 'page_ptr', 'path', 'url_path'}
+IGNORED_FIELDS = {CURSOR_FIELD, 'content_type', 'depth', 'first_published_at',
+                  'full_url', 'live', 'numchild', 'page_ptr', 'path', 'url_path'}
 NOT_REQUIRED_FIELDS = ['parent', 'slug']
+# number of rows read at once, the pages they update are fetched
+# with a single query and in bulk mode new pages are created together
+IMPORT_CHUNK_SIZE = 500
 
 
 class Error:
@@ -73,7 +98,33 @@ class Error:
         return format_html('<ul>{}: {}</ul>', self.msg, detailed_errors)
 
 
-def import_pages(csv_file, page_model):
+class ImportPlan:
+    """Compiled form and checks for importing a CSV header of a page model
+
+    The form class and its fields are built once per page model and
+    header, see get_import_plan. Columns of plain char, text, integer,
+    boolean and datetime fields get CSV form fields with a fast path
+    for the values exports write, see FastCleanMixin, while the rest
+    use regular form fields.
+
+    header_error is the error message for an invalid header, or None.
+
+    """
+
+    def __init__(self, page_model, fieldnames):
+        self.page_model = page_model
+        self.fieldnames = tuple(fieldnames)
+        self.form_class = get_form_class(page_model, self.fieldnames)
+        self.header_error = check_csv_header(self.fieldnames, page_model, self.form_class)
+
+
+@lru_cache(64)
+def get_import_plan(page_model, fieldnames):
+    """Return the ImportPlan for page_model and the tuple fieldnames"""
+    return ImportPlan(page_model, fieldnames)
+
+
+def import_pages(csv_file, page_model, bulk_create=False):
     """Create pages from a CSV file.
 
     CSV format should be the same as produced by
@@ -84,13 +135,20 @@ def import_pages(csv_file, page_model):
     matches the right value for the given page_model, otherwise the
     row will fail with a ValidationError.
 
+    If bulk_create is True rows without id are validated one by one,
+    but their pages are created in chunks by create_pages, which is
+    much faster for big imports. See its docstring for the caveats.
+
     """
     reader = csv.DictReader(csv_file)
     successes = []
     errors = []
 
     try:
-        form_class = get_form_class(page_model, reader.fieldnames)
+        plan = get_import_plan(page_model, tuple(reader.fieldnames or ()))
+    except UnicodeDecodeError as e:
+        errors.append(Error(_("Error decoding file, make sure it's an UTF-8 encoded CSV file"), e))
+        return successes, errors
     except csv.Error:
         errors.append(Error(_('File is not valid CSV'), None))
         return successes, errors
@@ -98,14 +156,34 @@ def import_pages(csv_file, page_model):
         errors.append(Error(_('Error in CSV header'), e))
         return successes, errors
 
-    error_msg = check_csv_header(reader.fieldnames, page_model, form_class)
-    if error_msg:
-        errors.append(Error(_('Error in CSV header'), error_msg))
+    if plan.header_error:
+        errors.append(Error(_('Error in CSV header'), plan.header_error))
         return successes, errors
 
+    form_class = plan.form_class
+
+    # (row number, form) of new pages waiting to be created in bulk
+    new_page_forms = []
+    # errors reading rows, reported after the errors of previous rows
+    read_errors = []
+    i = 0
     try:
-        for i, row in enumerate(reader, start=1):
-            page, error = import_page(row, i, page_model, form_class)
+        rows = read_rows(reader, read_errors)
+        for i, row, pages, references in prefetch_chunks(rows, plan):
+            if bulk_create and not row.get('id'):
+                form = form_class(row, references=references)
+                if form.is_valid():
+                    new_page_forms.append((i, form))
+                else:
+                    error = row_error(i, form.errors.as_data())
+                    logger.info('Errors importing row %s: %s', i, error)
+                    errors.append(error)
+                if len(new_page_forms) >= IMPORT_CHUNK_SIZE:
+                    create_pages_chunk(new_page_forms, page_model, successes, errors)
+                    new_page_forms = []
+                continue
+
+            page, error = import_page(row, i, page_model, form_class, pages, references)
             if error:
                 logger.info('Errors importing row %s: %s', i, error)
                 errors.append(error)
@@ -115,42 +193,310 @@ def import_pages(csv_file, page_model):
                     'title': page.title, 'id': page.pk
                 })
             elif page:
-                logger.info('Created page "%s" with id %d', page.title, page.pk)
-                successes.append(_('Created page %(title)s with id %(id)s') % {
-                    'title': page.title, 'id': page.pk
-                })
+                log_created_page(page, successes)
             else:
                 logger.error('')
+        if new_page_forms:
+            create_pages_chunk(new_page_forms, page_model, successes, errors)
     except Exception as e:
         # something unexpected happened, tell the user and make sure
         # we rollback the transaction
         logger.exception('Exception importing CSV file')
         errors.append(Error(_('Irrecoverable exception importing row number %(number)s') % {'number': i}, e))
+    errors.extend(read_errors)
+    if successes:
+        # pages created in bulk send no signals
+        bump_export_version()
 
     return successes, errors
 
 
-def import_page(row, row_number, page_model, form_class):
+def decode_lines(lines, encoding='utf-8'):
+    """Yield the lines of a binary file decoded one by one
+
+    lines can be any iterable of bytes lines, like Django's File and
+    UploadedFile, which read the file in chunks. So the whole file
+    never needs to be in memory, unlike decoding it at once.
+
+    """
+    for line in lines:
+        yield line.decode(encoding)
+
+
+def read_rows(reader, errors):
+    """Yield (row number, row) for the rows of reader, a csv.DictReader
+
+    If a row can't be decoded, see decode_lines, or isn't valid CSV,
+    an error with its number is added to errors and no more rows are
+    read.
+
+    """
+    row_number = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except UnicodeDecodeError as e:
+            logger.info('Error decoding row %s: %s', row_number + 1, e)
+            errors.append(Error(_("Error decoding row number %(number)s, make sure it's an UTF-8 encoded CSV file") % {
+                'number': row_number + 1
+            }, e))
+            return
+        except csv.Error as e:
+            logger.info('Error reading row %s: %s', row_number + 1, e)
+            errors.append(row_error(row_number + 1, e))
+            return
+        row_number += 1
+        yield row_number, row
+
+
+def prefetch_chunks(rows, plan):
+    """Yield (row number, row, pages, references) for every (row number, row) in rows
+
+    Rows are read in chunks, and the pages they update are fetched
+    with a single query per chunk, as well as the objects they
+    reference, see resolve_references. pages and references are
+    shared by all the rows of a chunk.
+
+    """
+    while True:
+        chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        chunk_rows = [row for i, row in chunk]
+        pages = get_existing_pages(chunk_rows, plan.page_model)
+        references = resolve_references(chunk_rows, plan.form_class)
+        for i, row in chunk:
+            yield i, row, pages, references
+
+
+def parse_page_id(value, page_model):
+    """Return the page id in value, or None if it's not a valid id"""
+    try:
+        return page_model._meta.pk.to_python(value)
+    except ValidationError:
+        return None
+
+
+def get_reference_fields(form_class):
+    """Return the fields of form_class that can use resolved references"""
+    reference_fields = {}
+    for name, field in form_class.base_fields.items():
+        if not isinstance(field, (CSVForeignKeyField, CSVM2MField)):
+            continue
+        # references are resolved by pk
+        if field.to_field_name in (None, field.queryset.model._meta.pk.name):
+            reference_fields[name] = field
+    return reference_fields
+
+
+def resolve_references(rows, form_class):
+    """Return the objects referenced by rows, by field name and pk
+
+    The ids in the parent, foreign key and many to many fields of
+    all rows are collected and fetched with one query per field, so
+    forms don't need a query per row and field to validate them.
+    Invalid ids are left for the form validation to report.
+
+    Like ModelForm does for the fields of each form, the querysets are
+    restricted by the limit_choices_to of the model fields, which the
+    fields of form classes don't have applied yet.
+
+    """
+    references = {}
+    for name, field in get_reference_fields(form_class).items():
+        pks = set()
+        for row in rows:
+            value = row.get(name)
+            if not value:
+                continue
+            values = value.split(',') if isinstance(field, CSVM2MField) else [value]
+            pks.update(get_reference_pk(field, v) for v in values)
+        pks.discard(None)
+        queryset = field.queryset
+        limit_choices_to = field.get_limit_choices_to()
+        if limit_choices_to is not None:
+            queryset = queryset.complex_filter(limit_choices_to)
+        references[name] = queryset.in_bulk(pks)
+    return references
+
+
+def get_reference_pk(field, value):
+    """Return the pk of the object referenced by value, None if invalid"""
+    try:
+        return field.queryset.model._meta.pk.to_python(value)
+    except ValidationError:
+        return None
+
+
+def get_existing_pages(rows, page_model):
+    """Return a dict of the pages with the ids in rows, by id"""
+    page_ids = {parse_page_id(row['id'], page_model) for row in rows if row.get('id')}
+    page_ids.discard(None)
+    if not page_ids:
+        return {}
+    return page_model.objects.in_bulk(page_ids)
+
+
+def row_error(row_number, value):
+    return Error(_('Errors processing row number %(number)s') % {'number': row_number}, value)
+
+
+def log_created_page(page, successes):
+    logger.info('Created page "%s" with id %d', page.title, page.pk)
+    successes.append(_('Created page %(title)s with id %(id)s') % {
+        'title': page.title, 'id': page.pk
+    })
+
+
+def import_page(row, row_number, page_model, form_class, pages=None, references=None):
+    """Create or update the page of a CSV row
+
+    pages is a dict of the existing pages by id, as returned by
+    get_existing_pages. If not given the page is fetched on its own.
+    Pages are removed from it when they're used, so if another row
+    updates the same page it's fetched again, without the changes the
+    form of this row makes to the instance. references are the
+    objects referenced by the row, as returned by resolve_references,
+    if not given the form fetches them itself.
+
+    """
     page_id = row.get('id')
     if page_id:
         # update existing page
-        page = page_model.objects.get(pk=page_id)
-        form = form_class(row, instance=page)
+        page_pk = parse_page_id(page_id, page_model)
+        page = pages.pop(page_pk, None) if pages is not None else None
+        if page is None:
+            page = get_existing_pages([row], page_model).get(page_pk)
+        if page is None:
+            return None, row_error(row_number, {'id': [
+                _('Page with id %(id)s does not exist') % {'id': page_id}
+            ]})
+        form = form_class(row, instance=page, references=references)
     else:
-        form = form_class(row)
+        form = form_class(row, references=references)
 
     if form.is_valid():
         try:
             with transaction.atomic():
                 page = form.save()
         except ValidationError as e:
-            return None, Error(_('Errors processing row number %(number)s') % {'number': row_number},
-                               e.message_dict)
+            return None, row_error(row_number, e.message_dict)
         else:
             return page, None
     else:
-        return None, Error(_('Errors processing row number %(number)s') % {'number': row_number},
-                           form.errors.as_data())
+        return None, row_error(row_number, form.errors.as_data())
+
+
+def create_pages_chunk(new_page_forms, page_model, successes, errors):
+    """Create the pages of new_page_forms, recording the results"""
+    pages, chunk_errors = create_pages(new_page_forms, page_model)
+    for page in pages:
+        log_created_page(page, successes)
+    for error in chunk_errors:
+        logger.info('Errors importing row: %s', error)
+    errors.extend(chunk_errors)
+
+
+def create_pages(new_page_forms, page_model):
+    """Create the pages of valid PageModelForms in bulk
+
+    new_page_forms is a list of (row number, form) tuples. Instead of
+    calling parent.add_child() for every page, pages are grouped by
+    parent and their tree paths computed from the last child of each
+    parent. Then the rows of the Page table and of the specific page
+    tables are inserted in batches and the numchild of each parent is
+    updated once.
+
+    Page.save() isn't called, so no post_save signals are sent, which
+    means for example that the search index isn't updated.
+
+    Returns the list of created pages, in the order of their rows, and
+    a list of errors for rows whose slug is already used by a sibling.
+
+    """
+    errors = []
+    forms_by_parent = defaultdict(list)
+    for row_number, form in new_page_forms:
+        forms_by_parent[form.cleaned_data['parent'].pk].append((row_number, form))
+    # read parents again, their paths could have changed since the
+    # rows were validated
+    parents = Page.objects.in_bulk(forms_by_parent)
+
+    new_pages = []
+    num_created = Counter()
+    for parent_id, parent_forms in forms_by_parent.items():
+        parent = parents[parent_id]
+        parent_pages = [(row_number, form, form.save(commit=False))
+                        for row_number, form in parent_forms]
+        # parents can have many children, only read the last one and
+        # the ones with the slugs of the new pages
+        children = parent.get_children()
+        last_path = children.order_by('-path').values_list('path', flat=True).first()
+        last_position = Page._str2int(last_path[-Page.steplen:]) if last_path else 0
+        slugs = set(children.filter(slug__in={page.slug for row_number, form, page in parent_pages})
+                            .values_list('slug', flat=True))
+        depth = parent.depth + 1
+        for row_number, form, page in parent_pages:
+            if page.slug in slugs:
+                errors.append(row_error(row_number, {'slug': [_('This slug is already in use')]}))
+                continue
+            slugs.add(page.slug)
+            last_position += 1
+            page.depth = depth
+            page.path = Page._get_path(parent.path, depth, last_position)
+            if len(page.path) > len(parent.path) + Page.steplen:
+                raise PathOverflow(_("Path Overflow from: '%s'") % parent.path)
+            page.numchild = 0
+            page.set_url_path(parent)
+            new_pages.append((row_number, form, page))
+            num_created[parent_id] += 1
+
+    new_pages.sort(key=lambda new_page: new_page[0])
+    pages = [page for row_number, form, page in new_pages]
+    with transaction.atomic():
+        insert_pages(pages, page_model)
+        for parent_id, num_pages in num_created.items():
+            Page.objects.filter(pk=parent_id).update(numchild=F('numchild') + num_pages)
+        for row_number, form, page in new_pages:
+            form.save_m2m()
+    return pages, errors
+
+
+def insert_pages(pages, page_model):
+    """Insert the rows of new pages with their paths already set
+
+    Page rows are inserted with bulk_create, and their ids read back
+    by path because not every database returns them. Django's
+    bulk_create doesn't support multi-table inheritance, so the rows
+    of the specific page tables are inserted like Model.save_base()
+    does, but many at once.
+
+    """
+    page_fields = [f for f in Page._meta.concrete_fields if not f.primary_key]
+    base_pages = [Page(**{f.attname: getattr(page, f.attname) for f in page_fields})
+                  for page in pages]
+    Page.objects.bulk_create(base_pages, batch_size=IMPORT_CHUNK_SIZE)
+    page_ids = dict(Page.objects.filter(path__in=[page.path for page in pages])
+                    .values_list('path', 'pk'))
+
+    specific_models = [m for m in reversed(page_model._meta.get_parent_list()) if m is not Page]
+    if page_model is not Page:
+        specific_models.append(page_model)
+    for page in pages:
+        page.id = page_ids[page.path]
+        for model in specific_models:
+            for parent_link in model._meta.parents.values():
+                setattr(page, parent_link.attname, page.id)
+
+    using = router.db_for_write(page_model)
+    ops = connections[using].ops
+    for model in specific_models:
+        fields = model._meta.local_concrete_fields
+        batch_size = max(ops.bulk_batch_size(fields, pages), 1)
+        for start in range(0, len(pages), batch_size):
+            model._base_manager._insert(pages[start:start + batch_size], fields=fields, using=using)
 
 
 def check_csv_header(header_row, page_model, form_class):
@@ -168,6 +514,8 @@ def check_csv_header(header_row, page_model, form_class):
     # detect unrecognized fields
     header_fields = set(header_row)
     all_valid_fields = set(get_exportable_fields_for_model(page_model))
+    # exports with continuation cursors can be imported as they are
+    all_valid_fields.add(CURSOR_FIELD)
     unrecognized_fields = header_fields - all_valid_fields
     if unrecognized_fields:
         return _('Unrecognized fields: %(field_list)s') % {
@@ -175,6 +523,132 @@ def check_csv_header(header_row, page_model, form_class):
         }
 
 
+class FastCleanMixin:
+    """Mixin for form fields with a fast path to clean CSV values
+
+    fast_clean() is tried first and returns the cleaned value, or
+    raises ValueError if the value isn't simple enough for it, in
+    which case the regular clean() is used. So errors are always the
+    same as those of the regular form field.
+
+    The fast path is only enabled if the field has no validators but
+    the ones in simple_validators, which fast_clean() checks itself.
+
+    Forms deep copy their fields, which is a big part of the cost of a
+    form per row. These fields don't have any state that changes per
+    form, so all forms of an import plan share them.
+
+    """
+    simple_validators = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fast_path = all(type(v) in self.simple_validators for v in self.validators)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def clean(self, value):
+        if self.fast_path and isinstance(value, str):
+            try:
+                return self.fast_clean(value)
+            except ValueError:
+                pass
+        return super().clean(value)
+
+    def fast_clean(self, value):
+        raise ValueError
+
+
+class CSVCharField(FastCleanMixin, forms.CharField):
+    simple_validators = (MaxLengthValidator, MinLengthValidator, ProhibitNullCharactersValidator)
+
+    def fast_clean(self, value):
+        if self.strip:
+            value = value.strip()
+        # empty values are handled by the regular clean
+        if not value or '\x00' in value:
+            raise ValueError
+        if self.max_length is not None and len(value) > self.max_length:
+            raise ValueError
+        if self.min_length is not None and len(value) < self.min_length:
+            raise ValueError
+        return value
+
+
+class CSVIntegerField(FastCleanMixin, forms.IntegerField):
+    simple_validators = (MaxValueValidator, MinValueValidator)
+
+    def fast_clean(self, value):
+        if self.localize:
+            raise ValueError
+        value = int(value)
+        if self.max_value is not None and value > self.max_value:
+            raise ValueError
+        if self.min_value is not None and value < self.min_value:
+            raise ValueError
+        return value
+
+
+class CSVBooleanField(FastCleanMixin, forms.BooleanField):
+    # values are already converted to bool by the CheckboxInput widget
+    pass
+
+
+class CSVDateTimeField(FastCleanMixin, forms.DateTimeField):
+    datetime_re = re.compile(r'(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)$')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # input_formats isn't a list since Django 3.1, only iterable
+        self.first_input_format = next(iter(self.input_formats), None)
+
+    def fast_clean(self, value):
+        # only the format of exported datetimes, when it's the first
+        # format the regular clean tries too
+        match = self.datetime_re.match(value)
+        if match is None or self.first_input_format != DATETIME_FORMAT:
+            raise ValueError
+        try:
+            return from_current_timezone(datetime(*map(int, match.groups())))
+        except ValidationError:
+            raise ValueError
+
+
+# form fields used to import model fields of these exact classes
+FAST_FIELD_CLASSES = {
+    models.BigIntegerField: CSVIntegerField,
+    models.BooleanField: CSVBooleanField,
+    models.CharField: CSVCharField,
+    models.DateTimeField: CSVDateTimeField,
+    models.IntegerField: CSVIntegerField,
+    models.PositiveIntegerField: CSVIntegerField,
+    models.PositiveSmallIntegerField: CSVIntegerField,
+    models.SmallIntegerField: CSVIntegerField,
+    models.TextField: CSVCharField,
+    RichTextField: CSVCharField,
+}
+
+
+class CSVForeignKeyField(forms.ModelChoiceField):
+    """Field to process foreign keys, like the parent page
+
+    If resolved_objects is set to a dict of objects by pk, as done by
+    PageModelForm with the references it's given, values are
+    validated with them instead of querying the database.
+
+    """
+    resolved_objects = None
+
+    def to_python(self, value):
+        if self.resolved_objects is None or value in self.empty_values:
+            return super().to_python(value)
+        obj = self.resolved_objects.get(get_reference_pk(self, value))
+        if obj is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return obj
+
+
 class CSVM2MField(forms.ModelMultipleChoiceField):
     """Field to process M2M fields with comma-separated values
 
@@ -183,21 +657,49 @@ class CSVM2MField(forms.ModelMultipleChoiceField):
     string of comma-separated values (e.g. "1,2,3"), which is the
     format used by the CSV exporter.
 
+    Like CSVForeignKeyField, it validates values with resolved_objects
+    if it's set, and then the cleaned value is a list of objects.
+
     """
+    resolved_objects = None
 
     def prepare_value(self, value):
         if isinstance(value, str):
             return value.split(',')
         return super().prepare_value(value)
 
+    def _check_values(self, value):
+        if self.resolved_objects is None:
+            return super()._check_values(value)
+        reference_pks = {pk: get_reference_pk(self, pk) for pk in value}
+        # like the regular field, malformed values are reported before
+        # missing ones
+        for pk, reference_pk in reference_pks.items():
+            if reference_pk is None:
+                raise ValidationError(self.error_messages['invalid_pk_value'],
+                                      code='invalid_pk_value', params={'pk': pk})
+        objs = []
+        for pk, reference_pk in reference_pks.items():
+            obj = self.resolved_objects.get(reference_pk)
+            if obj is None:
+                raise ValidationError(self.error_messages['invalid_choice'],
+                                      code='invalid_choice', params={'value': pk})
+            objs.append(obj)
+        return objs
+
 
 class PageModelForm(forms.ModelForm):
     content_type = forms.CharField(required=False)
     live = forms.BooleanField(initial=False, required=False)
-    parent = forms.ModelChoiceField(queryset=Page.objects.all(), required=True)
+    parent = CSVForeignKeyField(queryset=Page.objects.all(), required=True)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, references=None, **kwargs):
         super().__init__(*args, **kwargs)
+        # objects referenced by the row already fetched with the rest
+        # of its chunk, see resolve_references
+        for field_name, objs in (references or {}).items():
+            if field_name in self.fields:
+                self.fields[field_name].resolved_objects = objs
         if self.instance.pk is None:
             # Page.live defaults True, but we want to create pages in draft
             # unless live is purposefully set to True
@@ -206,6 +708,16 @@ class PageModelForm(forms.ModelForm):
             # parent is not necessary when updating an instance
             self.fields['parent'].required = False
 
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        # foreign keys validated with resolved references exist, the
+        # model doesn't need to check them again with a query each
+        resolved = [name for name, field in self.fields.items()
+                    if isinstance(field, CSVForeignKeyField) and field.resolved_objects is not None]
+        if isinstance(exclude, set):  # Django 4.1+
+            return exclude.union(resolved)
+        return exclude + resolved
+
     def clean_content_type(self):
         # type field is present in exporter CSV, if present we just
         # want to make sure it matches the type of the page model
@@ -236,8 +748,8 @@ class PageModelForm(forms.ModelForm):
         # changes.
         value = self.cleaned_data['parent']
         if self.instance.pk:
-            parent = self.instance.get_parent()
-            if value and parent != value:
+            # compare paths to avoid querying the current parent
+            if value and value.path != self.instance.path[:-self.instance.steplen]:
                 raise ValidationError(_('Cannot change parent page, moving pages is not yet supported.'))
         else:
             if not value:
@@ -263,9 +775,10 @@ class PageModelForm(forms.ModelForm):
             # live is not an editable field, so it's not set by
             # construct_instance on ModelForm._post_clean call
             page.live = self.cleaned_data['live']
-            parent = self.cleaned_data['parent']
-            parent.add_child(instance=page)
-            self.save_m2m()
+            if commit:
+                parent = self.cleaned_data['parent']
+                parent.add_child(instance=page)
+                self.save_m2m()
 
         return page
 
@@ -274,12 +787,22 @@ def get_form_class(page_model, fields):
     """Build a ModelForm for the given page model."""
     ignored_fields = {f.name for f in page_model._meta.fields if not f.editable}
     ignored_fields.update(IGNORED_FIELDS)
-    m2m_fields = page_model._meta.local_many_to_many
+    # generated fields are exported, but can't be imported
+    ignored_fields.update(get_generated_fields_for_model(page_model))
+    # use custom form fields for simple, FK and M2M fields
+    field_classes = {f.name: FAST_FIELD_CLASSES[type(f)] for f in page_model._meta.fields
+                     if type(f) in FAST_FIELD_CLASSES}
+    # nullable boolean fields use a NullBooleanField
+    for f in page_model._meta.fields:
+        if type(f) is models.BooleanField and f.null:
+            del field_classes[f.name]
+    field_classes.update({f.name: CSVForeignKeyField for f in page_model._meta.fields
+                          if f.many_to_one})
+    field_classes.update({f.name: CSVM2MField for f in page_model._meta.local_many_to_many})
     model_form = forms.modelform_factory(
         page_model, form=PageModelForm,
         fields=[f for f in fields if f not in ignored_fields],
-        # use custom form field for all M2M fields
-        field_classes={f.name: CSVM2MField for f in m2m_fields}
+        field_classes=field_classes
     )
     for field_name in NOT_REQUIRED_FIELDS:
         field = model_form.base_fields.get(field_name)
@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import secrets
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections
+from django.db import transaction
+from django.utils import timezone
+
+from .exporting import EXPORT_CHUNK_SIZE
+from .exporting import buffer_rows
+from .exporting import compress_blocks
+from .exporting import export_pages
+from .exporting import get_pages_to_export
+from .models import ExportJob
+from .models import get_worker_name
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the pool of threads that run export jobs
+
+    It's created on first use, with as many threads as the
+    WAGTAILCSVIMPORT_EXPORT_JOB_WORKERS setting, 1 by default.
+
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_JOB_WORKERS', 1)
+            _executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='wagtailcsvimport-export')
+        return _executor
+
+
+def start_export_job(job):
+    """Queue job to be run in the background
+
+    It's submitted once the current transaction is committed, so the
+    worker thread can see the job.
+
+    """
+    job.worker = get_worker_name()
+    job.heartbeat_at = timezone.now()
+    job.save(update_fields=['worker', 'heartbeat_at'])
+    transaction.on_commit(lambda: get_executor().submit(run_export_job, job.pk))
+
+
+def count_rows(csv_rows, job):
+    """Yield csv_rows while recording the progress of job
+
+    The first row is the header and isn't counted. rows_done is saved
+    after every chunk of rows, with the job's heartbeat.
+
+    """
+    rows_done = -1
+    for row in csv_rows:
+        yield row
+        rows_done += 1
+        if rows_done and rows_done % EXPORT_CHUNK_SIZE == 0:
+            ExportJob.objects.filter(pk=job.pk).update(rows_done=rows_done,
+                                                       heartbeat_at=timezone.now())
+    job.rows_done = max(rows_done, 0)
+
+
+def run_export_job(job_id):
+    """Export the pages of the job with job_id to a file
+
+    The CSV is written to a temporary file, in blocks, which is then
+    saved to the job's file field, see ExportJobStorage. Its name has a
+    random token so it can't be guessed. Any error marks the job as
+    failed.
+
+    """
+    job = ExportJob.objects.select_related('root_page', 'content_type').get(pk=job_id)
+    try:
+        job.status = ExportJob.RUNNING
+        job.worker = get_worker_name()
+        job.started_at = job.heartbeat_at = timezone.now()
+        root_pages = job.get_root_pages()
+        page_model, pages = get_pages_to_export(root_pages, job.content_type,
+                                                job.only_published)
+        job.total_rows = pages.count()
+        job.save(update_fields=['status', 'worker', 'started_at', 'heartbeat_at', 'total_rows'])
+
+        csv_rows = export_pages(root_pages, content_type=job.content_type,
+                                fieldnames=job.get_fieldnames(),
+                                only_published=job.only_published)
+        blocks = buffer_rows(count_rows(csv_rows, job))
+        filename = f'wagtail_export_{job.pk}_{secrets.token_urlsafe(16)}.csv'
+        if job.compress:
+            blocks = compress_blocks(blocks, 'gzip')
+            filename += '.gz'
+        with tempfile.TemporaryFile() as tmp_file:
+            for block in blocks:
+                tmp_file.write(block)
+            tmp_file.seek(0)
+            job.file.save(filename, File(tmp_file), save=False)
+
+        job.status = ExportJob.FINISHED
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at', 'rows_done', 'file'])
+        logger.info('Finished export job %s, %s rows', job.pk, job.rows_done)
+    except Exception as e:
+        logger.exception('Error running export job %s', job.pk)
+        job.status = ExportJob.FAILED
+        job.finished_at = timezone.now()
+        job.error = str(e)
+        job.save(update_fields=['status', 'finished_at', 'error'])
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            # worker threads open their own DB connections
+            connections.close_all()
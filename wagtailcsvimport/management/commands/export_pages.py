@@ -0,0 +1,90 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import get_current_timezone
+from django.utils.timezone import is_naive
+from django.utils.timezone import make_aware
+
+try:
+    from wagtail.core.models import Page
+except ImportError:  # fallback for Wagtail <2.0
+    from wagtail.wagtailcore.models import Page
+
+from wagtailcsvimport.exporting import export_pages_parallel
+
+
+class Command(BaseCommand):
+    help = "Export one or more pages and all their descendants to CSV, using multiple processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('root_page_ids', type=int, nargs='+', metavar='root_page_id',
+                            help="Id of a root page to export with its descendants")
+        parser.add_argument('--page-type',
+                            help="Only export pages of this type, e.g. blog.blogpage")
+        parser.add_argument('--fields',
+                            help="Comma-separated list of fields to export")
+        parser.add_argument('--all', action='store_true', dest='include_unpublished',
+                            help="Include unpublished pages")
+        parser.add_argument('--specific', action='store_true',
+                            help="Export pages of all types with their specific fields")
+        parser.add_argument('--since',
+                            help="Only export pages published or revised after this ISO 8601 datetime")
+        parser.add_argument('--workers', type=int,
+                            help="Number of worker processes, defaults to the number of CPUs")
+        parser.add_argument('--output', '-o',
+                            help="File to write the CSV to, defaults to stdout")
+
+    def handle(self, *args, **options):
+        root_pages = Page.objects.in_bulk(options['root_page_ids'])
+        for page_id in options['root_page_ids']:
+            if page_id not in root_pages:
+                raise CommandError(f"Page with id {page_id} does not exist")
+
+        content_type = None
+        if options['page_type']:
+            app_label, _sep, model = options['page_type'].lower().partition('.')
+            try:
+                content_type = ContentType.objects.get_by_natural_key(app_label, model)
+            except ContentType.DoesNotExist:
+                raise CommandError(f"Unknown page type {options['page_type']}")
+            page_model = content_type.model_class()
+            if page_model is None or not issubclass(page_model, Page):
+                raise CommandError(f"{options['page_type']} is not a page type")
+
+        since = None
+        if options['since']:
+            try:
+                since = parse_datetime(options['since'])
+            except ValueError:
+                pass
+            if since is None:
+                raise CommandError(f"Invalid datetime {options['since']}")
+            if is_naive(since):
+                since = make_aware(since, get_current_timezone())
+
+        fieldnames = options['fields'].split(',') if options['fields'] else None
+        csv_rows = export_pages_parallel(
+            list(root_pages.values()),
+            content_type=content_type,
+            fieldnames=fieldnames,
+            only_published=not options['include_unpublished'],
+            specific=options['specific'],
+            since=since,
+            workers=options['workers'],
+        )
+
+        output = None
+        if options['output']:
+            output = open(options['output'], 'w', encoding='utf-8', newline='')
+        try:
+            for rows in csv_rows:
+                if output is None:
+                    self.stdout.write(rows, ending='')
+                else:
+                    output.write(rows)
+        except ValueError as e:
+            raise CommandError(e)
+        finally:
+            if output is not None:
+                output.close()
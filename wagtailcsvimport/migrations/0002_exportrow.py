@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-17 01:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0001_initial'),
+        ('wagtailcsvimport', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportRow',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='export_row', serialize=False, to='wagtailcore.Page')),
+                ('url_path', models.TextField()),
+                ('data', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'export row',
+                'verbose_name_plural': 'export rows',
+            },
+        ),
+    ]
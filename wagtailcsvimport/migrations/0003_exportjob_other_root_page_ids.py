@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcsvimport', '0002_exportrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='other_root_page_ids',
+            field=models.TextField(blank=True),
+        ),
+    ]
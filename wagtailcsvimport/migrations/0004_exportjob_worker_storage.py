@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 01:40
+
+from django.db import migrations, models
+import wagtailcsvimport.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcsvimport', '0003_exportjob_other_root_page_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=wagtailcsvimport.models.ExportJobStorage(), upload_to='wagtailcsvimport/exports/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcsvimport', '0004_exportjob_worker_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportrow',
+            name='schema',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
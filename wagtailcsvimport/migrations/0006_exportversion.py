@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-17 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcsvimport', '0005_exportrow_schema'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'export version',
+                'verbose_name_plural': 'export versions',
+            },
+        ),
+    ]
@@ -0,0 +1,230 @@
+from datetime import timedelta
+import os
+import socket
+import tempfile
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.translation import ugettext_lazy as _
+try:
+    from wagtail.core.models import Page
+except ImportError:  # fallback for Wagtail <2.0
+    from wagtail.wagtailcore.models import Page
+
+
+@deconstructible
+class ExportJobStorage(FileSystemStorage):
+    """Private storage of the files of export jobs
+
+    Files are stored in the WAGTAILCSVIMPORT_EXPORT_JOB_DIR setting, by
+    default a directory in the system's temporary directory. They
+    have no URL, they're only served to admin users by the
+    export_job_download view.
+
+    """
+
+    @property
+    def base_location(self):
+        return getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_JOB_DIR',
+                       os.path.join(tempfile.gettempdir(), 'wagtailcsvimport-exports'))
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
+def get_worker_name():
+    """Return the name of the current process, to tell who runs a job"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def is_worker_alive(worker):
+    """Return whether the worker process is alive, or None if unknown
+
+    Only processes of the current host can be checked.
+
+    """
+    hostname, _sep, pid = worker.rpartition(':')
+    if hostname != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # exists, but belongs to another user
+        return True
+    return True
+
+
+class ExportJob(models.Model):
+    """Export of pages to a CSV file run in the background
+
+    Jobs are run by a local pool of worker threads, see
+    wagtailcsvimport.jobs, which write the CSV file to the private
+    ExportJobStorage and record their progress on the job.
+
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (FINISHED, _('Finished')),
+        (FAILED, _('Failed')),
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                             related_name='+', on_delete=models.SET_NULL)
+    root_page = models.ForeignKey(Page, related_name='+', on_delete=models.CASCADE)
+    # comma-separated ids of other pages to export with their descendants
+    other_root_page_ids = models.TextField(blank=True)
+    content_type = models.ForeignKey(ContentType, null=True, blank=True,
+                                     related_name='+', on_delete=models.CASCADE)
+    # comma-separated list of fields to export
+    fieldnames = models.TextField()
+    only_published = models.BooleanField(default=True)
+    compress = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # process that runs the job, see get_worker_name, and when it last
+    # recorded progress, to detect jobs whose process has died
+    worker = models.CharField(max_length=255, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    file = models.FileField(upload_to='wagtailcsvimport/exports/', storage=ExportJobStorage(),
+                            blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _('export job')
+        verbose_name_plural = _('export jobs')
+
+    def __str__(self):
+        return f'Export of {self.root_page_id} ({self.status})'
+
+    def get_fieldnames(self):
+        return self.fieldnames.split(',') if self.fieldnames else None
+
+    def get_root_pages(self):
+        if not self.other_root_page_ids:
+            return [self.root_page]
+        other_root_pages = Page.objects.filter(pk__in=self.other_root_page_ids.split(','))
+        return [self.root_page, *other_root_pages]
+
+    @property
+    def is_done(self):
+        return self.status in (self.FINISHED, self.FAILED)
+
+    @property
+    def is_stale(self):
+        """Return whether the job isn't done, but nobody is running it
+
+        Jobs are run by threads of server processes, so they're lost
+        when the process is restarted. If the process is in this host
+        it's checked whether it's alive, otherwise the job is stale if
+        it hasn't recorded progress for the time in seconds of the
+        WAGTAILCSVIMPORT_EXPORT_JOB_TIMEOUT setting, 1 hour by default.
+
+        """
+        if self.is_done:
+            return False
+        alive = is_worker_alive(self.worker)
+        if alive is not None:
+            return not alive
+        timeout = getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_JOB_TIMEOUT', 3600)
+        last_seen = self.heartbeat_at or self.created_at
+        return last_seen < timezone.now() - timedelta(seconds=timeout)
+
+    def fail_if_stale(self):
+        """Mark the job as failed if it's stale, see is_stale"""
+        if self.is_stale:
+            self.status = self.FAILED
+            self.finished_at = timezone.now()
+            self.error = str(_('The export was interrupted, please try again.'))
+            self.save(update_fields=['status', 'finished_at', 'error'])
+
+    @property
+    def progress(self):
+        """Return the percentage of rows exported, or None if unknown"""
+        if self.status == self.FINISHED:
+            return 100
+        if not self.total_rows:
+            return None
+        return min(100, 100 * self.rows_done // self.total_rows)
+
+    @property
+    def eta(self):
+        """Return the estimated remaining time as a timedelta
+
+        It's extrapolated from the time it took to export the rows
+        done so far. Returns None if it can't be estimated yet.
+
+        """
+        if self.status != self.RUNNING or not self.rows_done or not self.total_rows:
+            return None
+        elapsed = timezone.now() - self.started_at
+        remaining_rows = max(0, self.total_rows - self.rows_done)
+        return elapsed * remaining_rows / self.rows_done
+
+
+class ExportRow(models.Model):
+    """Values of the exportable fields of a page, already serialized
+
+    Only used if the WAGTAILCSVIMPORT_EXPORT_ROWS_TABLE setting is
+    True. Rows are updated when pages are saved, see
+    wagtailcsvimport.signals, so exports can read them instead of
+    serializing every page.
+
+    """
+    page = models.OneToOneField(Page, primary_key=True, related_name='export_row',
+                                on_delete=models.CASCADE)
+    # url_path when the row was serialized, if it changes the full
+    # URLs of the page's descendants must be updated too
+    url_path = models.TextField()
+    # key of the exportable fields of the page's model, rows with
+    # another key were serialized with other fields
+    schema = models.CharField(max_length=40, blank=True)
+    # JSON object of field names to their values as written to CSV
+    data = models.TextField()
+
+    class Meta:
+        verbose_name = _('export row')
+        verbose_name_plural = _('export rows')
+
+    def __str__(self):
+        return f'Export row of {self.page_id}'
+
+
+class ExportVersion(models.Model):
+    """Counter that is increased whenever pages change
+
+    It's part of the version of exports, see
+    wagtailcsvimport.caching.get_export_version, so that it changes
+    with any change to pages, not only when they are published or
+    revised. There's a single row, see bump_export_version.
+
+    """
+    number = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('export version')
+        verbose_name_plural = _('export versions')
+
+    def __str__(self):
+        return f'Export version {self.number}'
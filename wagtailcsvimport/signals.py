@@ -0,0 +1,147 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
+try:
+    from wagtail.core.models import Page
+    from wagtail.core.models import Site
+except ImportError:  # fallback for Wagtail <2.0
+    from wagtail.wagtailcore.models import Page
+    from wagtail.wagtailcore.models import Site
+
+from .caching import bump_export_version
+from .exporting import get_export_rows_enabled
+from .exporting import update_export_rows
+from .models import ExportRow
+
+
+def update_export_row(sender, instance, raw=False, **kwargs):
+    """Update the export row of a page when it's saved
+
+    Publishing, unpublishing and moving pages save them, so they are
+    handled here too. Rows of deleted pages are deleted with them.
+
+    If the page's url_path changed the export rows of its descendants
+    are deleted, as their full URLs depend on it. Wagtail updates the
+    descendants' url_path after this signal is sent, so they are
+    serialized again the next time they are exported.
+
+    """
+    if raw or not isinstance(instance, Page) or not get_export_rows_enabled():
+        return
+    old_url_path = ExportRow.objects.filter(page_id=instance.pk)\
+                                    .values_list('url_path', flat=True).first()
+    update_export_rows([instance.pk])
+    if old_url_path is not None and old_url_path != instance.url_path:
+        ExportRow.objects.filter(page__path__startswith=instance.path)\
+                         .exclude(page_id=instance.pk)\
+                         .delete()
+
+
+def get_related_page_ids(through, instance, page_model):
+    """Return the ids of pages of page_model related to instance by through"""
+    for field in page_model._meta.many_to_many:
+        if field.remote_field.through is through:
+            return set(page_model._default_manager.filter(**{field.name: instance.pk})
+                                                  .values_list('pk', flat=True))
+    return set()
+
+
+def update_export_rows_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Update export rows when M2M relations of pages change
+
+    When a relation is cleared from the other side, e.g. an object is
+    removed from all the pages it's related to, the ids of the pages
+    aren't sent, so they are fetched before it's cleared.
+
+    """
+    if not get_export_rows_enabled():
+        return
+    if reverse and action == 'pre_clear' and issubclass(model, Page):
+        instance._wagtailcsvimport_cleared_page_ids = get_related_page_ids(sender, instance, model)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        if isinstance(instance, Page):
+            update_export_rows([instance.pk])
+    elif issubclass(model, Page):
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_wagtailcsvimport_cleared_page_ids', None)
+        if pk_set:
+            update_export_rows(list(pk_set))
+
+
+def save_old_site_root_page(sender, instance, raw=False, **kwargs):
+    """Keep the root page a site had before it's saved"""
+    if raw or not instance.pk or not get_export_rows_enabled():
+        return
+    root_page_ids = Site.objects.filter(pk=instance.pk).values_list('root_page_id', flat=True)
+    instance._wagtailcsvimport_old_root_page_id = root_page_ids.first()
+
+
+def delete_site_export_rows(sender, instance, **kwargs):
+    """Delete the export rows of the pages of a site when it changes
+
+    Full URLs of pages depend on the hostname, port and root page of
+    their site, so the rows of the pages under its old and new root
+    pages are deleted, and serialized again the next time they are
+    exported.
+
+    """
+    if not get_export_rows_enabled():
+        return
+    root_page_ids = {
+        instance.root_page_id,
+        instance.__dict__.pop('_wagtailcsvimport_old_root_page_id', None),
+    }
+    root_paths = Page.objects.filter(pk__in=root_page_ids).values_list('path', flat=True)
+    if root_paths:
+        in_site = reduce(or_, [Q(page__path__startswith=path) for path in root_paths])
+        ExportRow.objects.filter(in_site).delete()
+
+
+def bump_export_version_on_save(sender, instance, **kwargs):
+    """Change the version of exports when pages or sites are saved or deleted
+
+    Full URLs depend on sites, and pages can be changed without
+    publishing them nor creating revisions, e.g. when they're moved or
+    imported.
+
+    """
+    if isinstance(instance, (Page, Site)):
+        bump_export_version()
+
+
+def bump_export_version_on_m2m_change(sender, instance, action, reverse, model, **kwargs):
+    """Change the version of exports when M2M relations of pages change"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        pages_changed = issubclass(model, Page)
+    else:
+        pages_changed = isinstance(instance, Page)
+    if pages_changed:
+        bump_export_version()
+
+
+def register_signal_handlers():
+    post_save.connect(update_export_row, dispatch_uid='wagtailcsvimport_update_export_row')
+    m2m_changed.connect(update_export_rows_m2m,
+                        dispatch_uid='wagtailcsvimport_update_export_rows_m2m')
+    pre_save.connect(save_old_site_root_page, sender=Site,
+                     dispatch_uid='wagtailcsvimport_save_old_site_root_page')
+    post_save.connect(delete_site_export_rows, sender=Site,
+                      dispatch_uid='wagtailcsvimport_delete_site_export_rows_on_save')
+    post_delete.connect(delete_site_export_rows, sender=Site,
+                        dispatch_uid='wagtailcsvimport_delete_site_export_rows_on_delete')
+    post_save.connect(bump_export_version_on_save,
+                      dispatch_uid='wagtailcsvimport_bump_export_version_on_save')
+    post_delete.connect(bump_export_version_on_save,
+                        dispatch_uid='wagtailcsvimport_bump_export_version_on_delete')
+    m2m_changed.connect(bump_export_version_on_m2m_change,
+                        dispatch_uid='wagtailcsvimport_bump_export_version_on_m2m_change')
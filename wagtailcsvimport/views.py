@@ -1,7 +1,22 @@
+from datetime import timedelta
+import multiprocessing
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.http import FileResponse
 from django.http import Http404
+from django.http import HttpResponseBadRequest
 from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.shortcuts import redirect
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import get_current_timezone
 from django.utils.timezone import get_current_timezone_name
+from django.utils.timezone import is_naive
+from django.utils.timezone import make_aware
 from django.utils.translation import ugettext as _
 
 try:
@@ -9,13 +24,76 @@ try:
 except ImportError:  # fallback for Wagtail <2.0
     from wagtail.wagtailcore.models import Page
 
+from .caching import get_export_params_key
+from .caching import get_export_version
+from .caching import get_snapshot_path
+from .caching import read_snapshot
+from .caching import write_snapshot
+from .exporting import buffer_rows
+from .exporting import compress_blocks
+from .exporting import decode_cursor
 from .exporting import export_pages
+from .exporting import export_pages_parallel
+from .exporting import get_compression_encodings
+from .exporting import get_export_database
 from .exporting import get_exportable_fields_for_model
 from .forms import ExportForm
 from .forms import ImportForm
 from .forms import PageTypeForm
-from .importing import Error
+from .importing import decode_lines
 from .importing import import_pages
+from .jobs import start_export_job
+from .models import ExportJob
+
+
+# Seconds between reloads of the progress page of export jobs
+EXPORT_JOB_REFRESH_INTERVAL = 3
+
+
+def get_content_encoding(request):
+    """Return the preferred supported encoding the client accepts, if any"""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, *params = item.split(';')
+        quality = 1
+        for param in params:
+            name, sep, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            accepted.add(encoding.strip().lower())
+    for encoding in get_compression_encodings():
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def get_export_response(request, blocks, compress=False):
+    """Return a streamed response with the given blocks of CSV data
+
+    If compress is True the download will be a gzip-compressed
+    .csv.gz file. Otherwise the CSV will be compressed on the fly if
+    the client accepts a supported Content-Encoding.
+
+    """
+    if compress:
+        response = StreamingHttpResponse(compress_blocks(blocks, 'gzip'),
+                                         content_type='application/gzip')
+        response['Content-Disposition'] = 'attachment; filename="wagtail_export.csv.gz"'
+        return response
+
+    encoding = get_content_encoding(request)
+    if encoding:
+        blocks = compress_blocks(blocks, encoding)
+    response = StreamingHttpResponse(blocks, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="wagtail_export.csv"'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
 
 
 def index(request):
@@ -51,12 +129,9 @@ def import_from_file(request):
             import_form = ImportForm(request.POST, request.FILES)
             if import_form.is_valid():
                 uploaded_file = import_form.cleaned_data['file']
-                try:
-                    csv_file = uploaded_file.read().decode('utf-8')
-                except UnicodeDecodeError as e:
-                    errors.append(Error(_("Error decoding file, make sure it's an UTF-8 encoded CSV file"), e))
-                else:
-                    successes, errors = import_pages(csv_file.splitlines(), page_model)
+                # decoded line by line as the file is read in chunks
+                successes, errors = import_pages(decode_lines(uploaded_file), page_model,
+                                                 bulk_create=import_form.cleaned_data['bulk_create'])
                 return render(request, 'wagtailcsvimport/import_from_file_results.html', {
                     'request': request,
                     'successes': successes,
@@ -88,7 +163,10 @@ def export_to_file(request):
     model's fields will be exported.
 
     HTTP response will be streamed, to reduce memory usage and avoid
-    response timeouts.
+    response timeouts. Rows are sent in blocks, see buffer_rows.
+
+    If the export is run in the background an ExportJob is created
+    instead, and the user is redirected to the job's progress page.
 
     """
     export_form = None
@@ -106,15 +184,28 @@ def export_to_file(request):
             if export_form.is_valid():
                 fields = export_form.cleaned_data['fields']
                 only_published = export_form.cleaned_data['only_published']
+                if export_form.cleaned_data['background']:
+                    job = ExportJob.objects.create(
+                        user=request.user,
+                        root_page=export_form.cleaned_data['root_page'],
+                        other_root_page_ids=','.join(
+                            str(page.pk) for page in export_form.cleaned_data['other_root_pages']
+                        ),
+                        content_type=content_type,
+                        fieldnames=','.join(fields),
+                        only_published=only_published,
+                        compress=export_form.cleaned_data['compress'],
+                    )
+                    start_export_job(job)
+                    return redirect('wagtailcsvimport:export_job', job_id=job.pk)
                 csv_rows = export_pages(
-                    export_form.cleaned_data['root_page'],
+                    export_form.get_root_pages(),
                     content_type=content_type,
                     fieldnames=fields,
                     only_published=only_published
                 )
-                response = StreamingHttpResponse(csv_rows, content_type='text/csv')
-                response['Content-Disposition'] = 'attachment; filename="wagtail_export.csv"'
-                return response
+                return get_export_response(request, buffer_rows(csv_rows),
+                                           compress=export_form.cleaned_data['compress'])
 
     return render(request, 'wagtailcsvimport/export_to_file.html', {
         'export_form': export_form,
@@ -124,25 +215,150 @@ def export_to_file(request):
     })
 
 
+def export_job(request, job_id):
+    """Show the progress of an export job, with a link to its file when done"""
+    job = get_object_or_404(ExportJob, pk=job_id)
+    # stop refreshing if the process running the job was restarted
+    job.fail_if_stale()
+    eta = job.eta
+    return render(request, 'wagtailcsvimport/export_job.html', {
+        # round to seconds for display
+        'eta': timedelta(seconds=round(eta.total_seconds())) if eta is not None else None,
+        'job': job,
+        'refresh_interval': EXPORT_JOB_REFRESH_INTERVAL,
+        'request': request,
+    })
+
+
+def export_job_download(request, job_id):
+    """Download the file of a finished export job"""
+    job = get_object_or_404(ExportJob, pk=job_id, status=ExportJob.FINISHED)
+    # without the random token of the stored file
+    filename = f'wagtail_export_{job.pk}.csv'
+    if job.compress:
+        filename += '.gz'
+    content_type = 'application/gzip' if job.compress else 'text/csv'
+    response = FileResponse(job.file.open('rb'), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 def export(request, page_id, only_published=False):
     """
     API endpoint of this source site to export a part of the page tree
     rooted at page_id
 
     Requests are made by a destination site's import_from_api view.
+
+    Only pages of the same type as the root page are exported. With
+    the "specific=1" query parameter pages of all types are exported
+    instead, each one with its specific fields.
+
+    With the "since" query parameter, an ISO 8601 datetime, only pages
+    published or revised after it are exported. Naive datetimes are
+    interpreted in the current timezone.
+
+    With the "cursor" query parameter a last "_cursor" column is added
+    with a continuation cursor for every row. An interrupted download
+    can be resumed from the last row received passing its cursor as
+    the parameter, an empty cursor starts from the beginning.
+
+    With the "shard" and "shards" query parameters only one of shards
+    disjoint slices of contiguous pages is exported, shard being its
+    0-based index, so clients can download the slices concurrently.
+
+    The CSV is compressed if the client sends a supported
+    Accept-Encoding. With the "format=csv.gz" query parameter a
+    gzip-compressed .csv.gz file is downloaded instead.
+
+    If the WAGTAILCSVIMPORT_EXPORT_WORKERS setting is greater than 1
+    pages are serialized by that many worker processes. They're
+    spawned for every request, forking a server process that may be
+    running other threads isn't safe.
+
+    Responses have an ETag that only changes when pages or sites
+    change, see get_export_version, so clients can poll with
+    If-None-Match and get a 304 response if nothing changed. If the
+    WAGTAILCSVIMPORT_EXPORT_SNAPSHOT_DIR setting is set the CSV is
+    stored there and served from disk while the ETag doesn't change,
+    except for exports with "since" or "cursor".
     """
+    using = get_export_database()
     if only_published:
-        pages = Page.objects.live()
+        pages = Page.objects.using(using).live()
     else:
-        pages = Page.objects.all()
+        pages = Page.objects.using(using).all()
 
     try:
         root_page = pages.get(pk=page_id)
     except Page.DoesNotExist:
         raise Http404
 
-    csv_rows = export_pages(root_page, content_type=root_page.content_type,
-                            only_published=only_published)
-    response = StreamingHttpResponse(csv_rows, content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="wagtail_export.csv"'
+    if request.GET.get('specific') == '1':
+        export_kwargs = {'specific': True}
+    else:
+        content_type = ContentType.objects.db_manager(using).get_for_id(root_page.content_type_id)
+        export_kwargs = {'content_type': content_type}
+
+    if request.GET.get('since'):
+        try:
+            since = parse_datetime(request.GET['since'])
+        except ValueError:
+            since = None
+        if since is None:
+            return HttpResponseBadRequest(_('Invalid since parameter, it must be an ISO 8601 datetime'))
+        if settings.USE_TZ and is_naive(since):
+            since = make_aware(since, get_current_timezone())
+        export_kwargs['since'] = since
+
+    if 'shard' in request.GET or 'shards' in request.GET:
+        try:
+            shard = (int(request.GET['shard']), int(request.GET['shards']))
+        except (KeyError, ValueError):
+            shard = None
+        if shard is None or not 0 <= shard[0] < shard[1]:
+            return HttpResponseBadRequest(
+                _('Invalid shard parameters, shard must be between 0 and shards - 1')
+            )
+        export_kwargs['shard'] = shard
+
+    if 'cursor' in request.GET:
+        export_kwargs['with_cursor'] = True
+        if request.GET['cursor']:
+            try:
+                export_kwargs['after'] = decode_cursor(request.GET['cursor'])
+            except ValueError:
+                return HttpResponseBadRequest(_('Invalid cursor parameter'))
+
+    version = get_export_version(root_page, only_published=only_published, **export_kwargs)
+    etag = f'W/"{version}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    params_key = get_export_params_key(root_page, only_published=only_published, **export_kwargs)
+    if 'after' in export_kwargs or 'since' in export_kwargs:
+        # don't keep a snapshot for every resumed download or for
+        # every datetime incremental exports are requested since
+        snapshot_path = None
+    else:
+        snapshot_path = get_snapshot_path(params_key, version)
+    blocks = read_snapshot(snapshot_path)
+    if blocks is None:
+        workers = getattr(settings, 'WAGTAILCSVIMPORT_EXPORT_WORKERS', 1)
+        if workers > 1:
+            csv_rows = export_pages_parallel(root_page, only_published=only_published,
+                                             workers=workers,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             **export_kwargs)
+        else:
+            csv_rows = export_pages(root_page, only_published=only_published,
+                                    **export_kwargs)
+        blocks = buffer_rows(csv_rows)
+        if snapshot_path is not None:
+            blocks = write_snapshot(blocks, snapshot_path)
+
+    response = get_export_response(request, blocks,
+                                   compress=request.GET.get('format') == 'csv.gz')
+    response['ETag'] = etag
     return response